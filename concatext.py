@@ -13,6 +13,9 @@ If a dir_path is specified via command line, it takes precedence over the value
 """
 
 import os
+import sys
+import contextlib
+import functools
 import fnmatch
 import yaml
 import logging
@@ -23,14 +26,200 @@ import ssl
 import time
 import argparse
 import re
+import json
+import math
+import hashlib
+import random
+import subprocess
+import tempfile
+import queue
+import heapq
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from datetime import datetime
 
+# Optional: streams notebooks cell by cell instead of loading the whole JSON document
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Upper bound of bytes kept per extension in the token ratios history
+RATIO_HISTORY_BYTES = 100 * 1024 * 1024
+
+# Supported tokenizer modes, see DirContentProcessor.count_tokens
+TOKENIZER_MODES = ("nltk", "nltk_lines", "approximate")
+
+# Separates the lines tokenized together by the line cache, tokenized as a single token
+LINE_SENTINEL = "\u2063"
+# NLTK splits a period off the last word only at the very end of the text
+FINAL_PERIOD = re.compile(r'[^.]\.[\]\)}>"\']*\s*$')
+
+# Supported file ordering modes, see DirContentProcessor.walk_files
+ORDERING_MODES = ("filesystem", "sorted", "grouped")
+
+# Ways of placing output file boundaries, see ChunkAssembler
+CHUNKING_MODES = ("greedy", "content_defined")
+
+# Rules ranking files for total_token_budget, see DirContentProcessor.budget_sort_key
+BUDGET_RULES = ("explicit", "patterns", "recent", "smallest")
+
+# Ways of splitting the walk between shards: by hash of the relative path, or in contiguous ranges
+SHARD_METHODS = ("hash", "range")
+
+# Configuration keys that may differ between the shards of one run: they do not
+# change the blocks written to the manifests (output files are packed by --merge,
+# shard_method is compared on its own)
+SHARD_LOCAL_KEYS = {
+    "dir_path", "output_dir", "shard", "shard_method", "max_tokens", "chunking", "chunk_min_tokens",
+    "chunk_target_tokens", "checkpoint_interval", "stream_format", "stream_delimiter", "serve_workers",
+    "hotspot_report", "hotspot_depth", "hotspot_top_files", "file_manifest",
+}
+
+# Head and tail reads of truncated files cover this many times the expected size of their token budget
+TRUNCATION_READ_FACTOR = 2
+
+# String literal and comment syntaxes used by the compaction stage.
+# Strings are matched first so comment markers inside them are kept.
+_DOUBLE_QUOTED = r'"(?:\\.|[^"\\\n])*"'
+_SINGLE_QUOTED = r"'(?:\\.|[^'\\\n])*'"
+_TRIPLE_QUOTED = r'"""[\s\S]*?"""|\'\'\'[\s\S]*?\'\'\''
+_HASH_COMMENT = r'(?:(?<=\s)|^)#(?!!)[^\n]*'
+_C_COMMENTS = r'//[^\n]*|/\*[\s\S]*?\*/'
+# C++ raw strings R"delim(...)delim", Go raw strings `...`, C# verbatim strings @"..." ("" escapes a quote)
+_CPP_RAW = r'R"(?P<delimiter>[^()\\\s"]{0,16})\([\s\S]*?\)(?P=delimiter)"'
+_BACKTICK_RAW = r'`[^`]*`'
+_VERBATIM = r'(?:\$@|@\$?)"(?:[^"]|"")*"'
+# JavaScript regex literals, recognized where an expression starts (after an operator,
+# a bracket or return/typeof) so that a division is not taken for one
+_JS_REGEX = (r'(?:(?<=[=(,:;\[!&|?{}])|(?<=\breturn)|(?<=\btypeof))[ \t]*'
+             r'/(?![/*])(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n\[])+/[a-z]*')
+# YAML block scalars (key: | or key: >): the lines indented below the key are content, not comments
+_YAML_BLOCK = (r'^(?P<yaml_indent>[ \t]*)[^\n#]*[:\-][ \t]*[|>][-+0-9]*[ \t]*(?:#[^\n]*)?\n'
+               r'(?:(?P=yaml_indent)[ \t]+[^\n]*(?:\n|$)|[ \t]*\n)*')
+COMMENT_STYLES = {
+    "c": ([_CPP_RAW, _DOUBLE_QUOTED, _SINGLE_QUOTED], _C_COMMENTS),
+    "go": ([_BACKTICK_RAW, _DOUBLE_QUOTED, _SINGLE_QUOTED], _C_COMMENTS),
+    # Java, Kotlin, Scala, Swift, Groovy and Dart have triple-quoted multi-line strings
+    "jvm": ([_TRIPLE_QUOTED, _DOUBLE_QUOTED, _SINGLE_QUOTED], _C_COMMENTS),
+    "csharp": ([r'"""[\s\S]*?"""', _VERBATIM, _DOUBLE_QUOTED, _SINGLE_QUOTED], _C_COMMENTS),
+    "js": ([_DOUBLE_QUOTED, _SINGLE_QUOTED, r'`(?:\\.|[^`\\])*`', _JS_REGEX], _C_COMMENTS),
+    "rust": ([_DOUBLE_QUOTED, r"'(?:\\.[^'\n]*|[^'\\\n])'"], _C_COMMENTS),
+    "css": ([_DOUBLE_QUOTED, _SINGLE_QUOTED], r'/\*[\s\S]*?\*/'),
+    "python": ([_TRIPLE_QUOTED, _DOUBLE_QUOTED, _SINGLE_QUOTED], _HASH_COMMENT),
+    "hash": ([_DOUBLE_QUOTED, _SINGLE_QUOTED], _HASH_COMMENT),
+    "yaml": ([_YAML_BLOCK, _DOUBLE_QUOTED, _SINGLE_QUOTED], _HASH_COMMENT),
+    "sql": ([_SINGLE_QUOTED, _DOUBLE_QUOTED], r'--[^\n]*|/\*[\s\S]*?\*/'),
+    "lua": ([_DOUBLE_QUOTED, _SINGLE_QUOTED], r'--\[\[[\s\S]*?\]\]|--[^\n]*'),
+    "markup": ([], r'<!--[\s\S]*?-->'),
+}
+EXTENSION_COMMENT_STYLES = {
+    **dict.fromkeys([".c", ".h", ".cc", ".cpp", ".hpp", ".php", ".m", ".proto"], "c"),
+    **dict.fromkeys([".go"], "go"),
+    **dict.fromkeys([".java", ".kt", ".kts", ".scala", ".swift", ".groovy", ".gradle", ".dart"], "jvm"),
+    **dict.fromkeys([".cs"], "csharp"),
+    **dict.fromkeys([".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx"], "js"),
+    **dict.fromkeys([".rs"], "rust"),
+    **dict.fromkeys([".css", ".scss", ".less"], "css"),
+    **dict.fromkeys([".py", ".pyw", ".pyi"], "python"),
+    **dict.fromkeys([".sh", ".bash", ".zsh", ".rb", ".pl", ".r", ".toml",
+                     ".cfg", ".conf", ".dockerfile", ".mk", ".cmake", ".ps1"], "hash"),
+    **dict.fromkeys([".yaml", ".yml"], "yaml"),
+    **dict.fromkeys([".sql"], "sql"),
+    **dict.fromkeys([".lua"], "lua"),
+    **dict.fromkeys([".html", ".htm", ".xml", ".svg", ".vue", ".md"], "markup"),
+}
+COMMENT_PATTERNS = {
+    style: re.compile("|".join(([f"(?P<string>{'|'.join(strings)})"] if strings else [])
+                               + [f"(?P<comment>{comments})"]), re.MULTILINE)
+    for style, (strings, comments) in COMMENT_STYLES.items()
+}
+LEADING_WHITESPACE = re.compile(r'\s*')
+LICENSE_KEYWORDS = re.compile(r'copyright|licen[cs]e|spdx-license-identifier|all rights reserved', re.IGNORECASE)
+
+# Default options of the content compaction stage
+DEFAULT_COMPACTION = {
+    "enabled": False,
+    "strip_comments": True,  # Remove comments of languages recognized by extension
+    "strip_license": True,  # Remove a license banner at the top of the file
+    "strip_trailing_whitespace": True,
+    "collapse_blank_lines": True,  # Reduce runs of blank lines to a single one
+    "reindent": False,  # Divide indentation by its common width (keeps the structure)
+}
+
+# Default options of the Jupyter notebook reader
+DEFAULT_NOTEBOOKS = {
+    "enabled": True,  # Keep only the cell sources of .ipynb files instead of their raw JSON
+    "outputs": False,  # Also keep the text outputs of code cells
+    "max_output_chars": 1000,  # Longer outputs of a cell are replaced by a note
+}
+
+# Errors of a notebook that is not valid JSON or has fields of unexpected types,
+# it is then read as a plain text file
+NOTEBOOK_ERRORS = (ValueError, TypeError) + ((ijson.JSONError,) if ijson else ())
+
+# Default options of the generated file detection, run on the first bytes of each file
+DEFAULT_GENERATED_FILES = {
+    "enabled": True,
+    "action": "placeholder",  # "placeholder" replaces the content, "skip" leaves the file out
+    "placeholder": "generated file omitted ({reason})",
+    "sample_bytes": 4096,  # Bytes read to classify a file
+    "max_average_line_length": 250,  # Longer average lines are taken for minified content (MINIFIABLE_EXTENSIONS)
+    "keep_patterns": [],  # Files never classified as generated
+}
+GENERATED_FILE_ACTIONS = ("placeholder", "skip")
+
+# Dependency lockfiles of common package managers
+LOCKFILE_NAMES = {
+    "package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml", "bun.lock",
+    "poetry.lock", "Pipfile.lock", "pdm.lock", "uv.lock", "Cargo.lock", "composer.lock",
+    "Gemfile.lock", "go.sum", "mix.lock", "pubspec.lock", "Podfile.lock", "packages.lock.json",
+    "flake.lock", "gradle.lockfile", "conan.lock",
+}
+
+# File name patterns of generated content
+GENERATED_FILE_PATTERNS = {
+    "*.min.js": "minified bundle",
+    "*.min.mjs": "minified bundle",
+    "*.min.css": "minified stylesheet",
+    "*.map": "source map",
+    "*_pb2.py": "generated protobuf code",
+    "*_pb2.pyi": "generated protobuf code",
+    "*_pb2_grpc.py": "generated protobuf code",
+    "*.pb.go": "generated protobuf code",
+    "*.pb.cc": "generated protobuf code",
+    "*.pb.h": "generated protobuf code",
+    "*_pb.js": "generated protobuf code",
+    "*_pb.d.ts": "generated protobuf code",
+}
+
+# Markers of generated files, looked for in their first lines only
+# Only the standard header forms match, case-sensitively: prose such as "id is auto-generated"
+# or "do not edit the values below" in hand-written files must not
+GENERATED_MARKERS = re.compile(r'@generated\b|^(?://|#) Code generated .* DO NOT EDIT\.$'
+                               r'|[Gg]enerated by the protocol buffer compiler', re.MULTILINE)
+GENERATED_MARKER_LINES = 10
+# Samples shorter than this are not judged on their line length
+MIN_LINE_LENGTH_SAMPLE = 1024
+# Extensions judged on their line length: code and assets that are commonly minified,
+# prose and data files (including JSON, often written on one line) legitimately have long lines
+MINIFIABLE_EXTENSIONS = {".js", ".mjs", ".cjs", ".css", ".svg"}
+
+# Process umask, read once on import: it can only be read by setting it
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+# Maximum number of output files waiting for the background writer
+WRITER_QUEUE_SIZE = 4
+
+# Chunk framings of --stdout: a delimiter line before each chunk, or a JSON header line with its length
+STREAM_FORMATS = ("delimited", "frames")
+
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+# Handlers are configured by the entry points (main, the GUI), not on import
 logger = logging.getLogger('concatext')
 
 # Resolve SSL certificate issue for NLTK downloads
@@ -48,6 +237,9 @@ except Exception as e:
     logger.warning(f"Failed to download NLTK data: {e}")
     logger.warning("Some functionality may be limited")
 
+class ConcatextError(Exception):
+    """Raised when processing cannot go on, with a message for the user."""
+
 def format_size(size_bytes):
     """
     Convert bytes to a human-readable string with appropriate units.
@@ -67,13 +259,705 @@ def format_size(size_bytes):
     
     return f"{size_bytes:.2f} {units[unit_index]}"
 
-def load_config(config_path='config.yaml', override_dir_path=None):
+def file_extension(file_path):
+    """
+    Return the lowercase extension used to group files in statistics and token ratios.
+    
+    Args:
+        file_path (Path): Path of the file
+    
+    Returns:
+        str: Extension including the dot, or "(none)" for files without one
+    """
+    return file_path.suffix.lower() or "(none)"
+
+def notebook_text(value):
+    """
+    Join a notebook text field, stored either as a string or as a list of lines.
+    
+    Args:
+        value (str or list): Field value, such as the source of a cell
+    
+    Returns:
+        str: The text
+    """
+    if isinstance(value, list):
+        return "".join(value)
+    if value is not None and not isinstance(value, str):
+        raise TypeError(f"expected text, got {type(value).__name__}")
+    return value or ""
+
+def trim_partial_character(data, at_end):
+    """
+    Remove the incomplete UTF-8 sequence at one end of a window of bytes read from a file.
+    
+    Args:
+        data (bytes): Window read from the middle of a file
+        at_end (bool): Trim the end of the window instead of its start
+    
+    Returns:
+        bytes: The window without the split character
+    """
+    if not at_end:
+        # Continuation bytes at the start belong to a character that began before the window
+        start = 0
+        while start < min(len(data), 3) and data[start] & 0xC0 == 0x80:
+            start += 1
+        return data[start:]
+
+    # Find the lead byte of the last character and drop it if the window ends before its last byte
+    index = len(data) - 1
+    while index > max(len(data) - 4, 0) and data[index] & 0xC0 == 0x80:
+        index -= 1
+    if index < 0 or data[index] < 0xC0:
+        return data  # ASCII, or invalid data left for the decoder to report
+    length = 2 if data[index] < 0xE0 else 3 if data[index] < 0xF0 else 4
+    return data[:index] if len(data) - index < length else data
+
+def write_atomic(file_path, data):
+    """
+    Write bytes to a file through a temporary file and a rename,
+    so readers never see a partially written file.
+    
+    Args:
+        file_path (Path): Destination file
+        data (bytes): Content to write
+    """
+    # A unique temporary file, so concurrent jobs (see serve) writing the same file do not collide
+    fd, temp_file = tempfile.mkstemp(prefix=f".{file_path.name}.", suffix=".tmp", dir=file_path.parent)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # mkstemp creates private files, give the result the usual permissions
+        os.chmod(temp_file, 0o666 & ~UMASK)
+        os.replace(temp_file, file_path)
+    except BaseException:
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+        raise
+
+class ChunkWriter:
+    """
+    Background thread writing output files, so tokenization continues while
+    a finished output file is flushed to disk.
+    """
+    def __init__(self, max_pending=WRITER_QUEUE_SIZE, logger=None):
+        self.logger = logger or logging.getLogger('concatext')
+        # Bounded queue: the processor blocks instead of piling up output files in memory
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.output_files = []  # Filled by the writer thread, in submission order
+        self.error = None  # Unexpected exception of the writer thread, raised again to the processor
+        self.thread = threading.Thread(target=self.run, name="concatext-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, output_file, content, token_count, source_file_count, max_tokens=None):
+        """Queue an output file for writing."""
+        self.raise_error()
+        self.queue.put((output_file, content, token_count, source_file_count, max_tokens))
+
+    def run(self):
+        """Write queued output files until close() is called."""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+            # After a failure the queue is still drained, so submit and close never block
+            if self.error is None:
+                try:
+                    self.write(*item)
+                except Exception as e:
+                    self.error = e
+            self.queue.task_done()
+
+    def raise_error(self):
+        """Raise the exception that stopped the writer thread, if any."""
+        if self.error is not None:
+            raise self.error
+
+    def write(self, output_file, content, token_count, source_file_count, max_tokens=None):
+        """Write one output file and record its information."""
+        data = content.encode('utf-8')
+        try:
+            write_atomic(output_file, data)
+        except OSError as e:
+            self.logger.error(f"Error writing to file {output_file}: {e}")
+            return
+
+        # The size comes from the written data, no extra stat needed
+        self.output_files.append({
+            'filename': str(output_file),
+            'token_count': token_count,
+            'file_size': len(data),
+            'source_file_count': source_file_count,
+            'max_tokens': max_tokens
+        })
+        self.logger.info(f"Created {output_file} with {token_count:,} tokens from {source_file_count} files.")
+
+    def wait(self):
+        """Block until every queued output file has been written."""
+        self.queue.join()
+        self.raise_error()
+
+    def close(self):
+        """Wait until all queued output files are written."""
+        self.queue.put(None)
+        self.thread.join()
+        self.raise_error()
+
+class StreamWriter(ChunkWriter):
+    """
+    Background thread writing output files to a binary stream, such as
+    standard output, instead of output_dir.
+    """
+    def __init__(self, stream, stream_format="delimited", delimiter="", cancel_event=None, logger=None):
+        self.stream = stream
+        self.stream_format = stream_format
+        self.delimiter = delimiter
+        # Set when the reader goes away, so the processor stops early
+        self.cancel_event = cancel_event
+        self.chunk_counter = 0
+        self.broken = False
+        super().__init__(logger=logger)
+
+    def write(self, output_file, content, token_count, source_file_count, max_tokens=None):
+        """Write one chunk with its delimiter or frame header and record its information."""
+        if self.broken:
+            return
+        data = content.encode('utf-8')
+        self.chunk_counter += 1
+        fields = {'index': self.chunk_counter, 'tokens': token_count, 'files': source_file_count, 'bytes': len(data)}
+        if self.stream_format == "frames":
+            header = json.dumps({'chunk': self.chunk_counter, 'name': output_file.name, 'bytes': len(data),
+                                 'tokens': token_count, 'source_files': source_file_count}) + "\n"
+        else:
+            header = self.delimiter.format(**fields)
+        try:
+            self.stream.write(header.encode('utf-8'))
+            self.stream.write(data)
+            self.stream.flush()
+        except OSError as e:
+            # Typically a closed pipe: nothing more can be delivered
+            self.logger.error(f"Error writing chunk {self.chunk_counter} to the output stream: {e}")
+            self.broken = True
+            if self.cancel_event:
+                self.cancel_event.set()
+            return
+
+        self.output_files.append({
+            'filename': f"<stream> chunk {self.chunk_counter} ({output_file.name})",
+            'token_count': token_count,
+            'file_size': len(data),
+            'source_file_count': source_file_count,
+            'max_tokens': max_tokens
+        })
+        self.logger.info(f"Streamed chunk {self.chunk_counter} with {token_count:,} tokens from {source_file_count} files.")
+
+def stream_options(config):
+    """
+    Read the --stdout framing options of a configuration.
+    
+    Args:
+        config (dict): Configuration with the optional stream_format and stream_delimiter keys
+    
+    Returns:
+        dict: Keyword arguments for StreamWriter
+    """
+    stream_format = config.get("stream_format", "delimited")
+    if stream_format not in STREAM_FORMATS:
+        raise ConcatextError(f"Error: Unknown stream_format '{stream_format}', expected one of: {', '.join(STREAM_FORMATS)}.")
+    delimiter = config.get("stream_delimiter", "--- concatext chunk {index}: {tokens} tokens, {files} files ---\n")
+    try:
+        delimiter.format(index=0, tokens=0, files=0, bytes=0)
+    except (KeyError, IndexError, ValueError) as e:
+        raise ConcatextError(f"Error: Invalid stream_delimiter, available fields are {{index}}, {{tokens}}, {{files}}, {{bytes}}: {e}")
+    return {'stream_format': stream_format, 'delimiter': delimiter}
+
+class ChunkAssembler:
+    """
+    Packs formatted file blocks into output files of at most max_tokens tokens
+    and hands every finished output file to a ChunkWriter.
+    """
+    extension = ".txt"
+
+    def __init__(self, writer, output_dir, dir_name, max_tokens, file_separator, separator_token_count,
+                 chunking="greedy", min_tokens=0, target_tokens=None, name_prefix=None):
+        self.writer = writer
+        self.output_dir = output_dir
+        self.dir_name = dir_name
+        # Output files are named <name_prefix>_NN, several assemblers sharing a writer need distinct prefixes
+        self.name_prefix = name_prefix or dir_name
+        self.MAX_TOKENS = max_tokens
+        self.file_separator = file_separator
+        self.separator_token_count = separator_token_count
+        self.content = ""
+        self.file_counter = 1
+        self.current_token_count = 0
+        self.current_source_files = 0  # Counter for source files in the current output file
+
+        # "greedy" fills every output file up to max_tokens; "content_defined" ends an output file
+        # after a block whose hash selects it as a boundary, so that edits only move nearby boundaries
+        self.chunking = chunking
+        self.min_tokens = min_tokens
+        # Tokens expected between min_tokens and a content-defined boundary
+        self.boundary_tokens = max((target_tokens or max_tokens) - min_tokens, 1)
+        self.boundary_counts = {'content': 0, 'forced': 0}
+
+    def add_block(self, path_block, block_token_count, relative_path=None):
+        """Add a file block, starting a new output file when the token limit is reached."""
+        # Add separator if not the first file in the content
+        if self.content and self.file_separator:
+            # Check if adding separator would exceed limit
+            if self.current_token_count + self.separator_token_count > self.MAX_TOKENS:
+                self.save_current_content(forced=True)
+            else:
+                # Add separator and update token count
+                self.content += self.file_separator
+                self.current_token_count += self.separator_token_count
+
+        # If adding this block exceeds the limit, save and restart
+        if self.current_token_count + block_token_count > self.MAX_TOKENS:
+            self.save_current_content(forced=True)
+
+        self.append_block(path_block, block_token_count, relative_path)
+        self.current_token_count += block_token_count
+        self.current_source_files += 1 # Increment source file counter for this output file
+
+        if (self.chunking == "content_defined" and self.current_token_count >= self.min_tokens
+                and self.is_boundary(path_block, block_token_count)):
+            self.boundary_counts['content'] += 1
+            self.save_current_content()
+
+    def is_boundary(self, path_block, block_token_count):
+        """Decide from the block content whether an output file ends after this block."""
+        # The chance grows with the block size, so boundaries come every boundary_tokens on average
+        digest = hashlib.sha1(path_block.encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big') / 2**64 < block_token_count / self.boundary_tokens
+
+    def append_block(self, path_block, block_token_count, relative_path):
+        """Append a file block to the output file being built."""
+        self.content += path_block
+
+    def chunk_name(self):
+        """Return the name of the output file being built, without extension."""
+        # Format the counter with at least 2 digits
+        return f'{self.name_prefix}_{self.file_counter:02d}'
+
+    def render(self):
+        """Return the final text of the output file being built."""
+        return self.content.rstrip() + "\n"
+
+    def save_current_content(self, forced=False):
+        """Hand accumulated content to the writer and reset the buffer."""
+        if self.content.strip():
+            if forced and self.chunking == "content_defined":
+                self.boundary_counts['forced'] += 1
+            output_file = self.output_dir / f'{self.chunk_name()}{self.extension}'
+            
+            self.writer.submit(output_file, self.render(),
+                               self.current_token_count, self.current_source_files, self.MAX_TOKENS)
+            self.file_counter += 1
+            self.content = ""
+            self.current_token_count = 0
+            self.current_source_files = 0  # Reset the source file counter
+
+    def get_state(self):
+        """Return the state of the output file being built, for checkpoints."""
+        return {
+            'file_counter': self.file_counter,
+            'content': self.content,
+            'current_token_count': self.current_token_count,
+            'current_source_files': self.current_source_files,
+            'boundary_counts': self.boundary_counts,
+        }
+
+    def set_state(self, state):
+        """Restore a state returned by get_state."""
+        self.file_counter = state['file_counter']
+        self.content = state['content']
+        self.current_token_count = state['current_token_count']
+        self.current_source_files = state['current_source_files']
+        self.boundary_counts = state['boundary_counts']
+
+class JsonlChunkAssembler(ChunkAssembler):
+    """
+    Packs file contents like ChunkAssembler, but writes each output file as JSON Lines:
+    one record per source file with its path, chunk, token count, byte length, hash and content.
+    """
+    extension = ".jsonl"
+
+    def append_block(self, path_block, block_token_count, relative_path):
+        """Append the record of a file block, serialized right away."""
+        data = path_block.encode('utf-8')
+        record = {
+            'chunk': self.chunk_name(),
+            'path': relative_path,
+            'tokens': block_token_count,
+            'bytes': len(data),
+            'sha256': hashlib.sha256(data).hexdigest(),
+            'content': path_block,
+        }
+        self.content += json.dumps(record, ensure_ascii=False) + "\n"
+
+    def render(self):
+        """Return the records of the output file being built."""
+        return self.content
+
+# Output file formats: template-formatted text, or JSON Lines records (see JsonlChunkAssembler)
+OUTPUT_ASSEMBLERS = {"text": ChunkAssembler, "jsonl": JsonlChunkAssembler}
+
+class HotspotReport:
+    """
+    Aggregates tokens, bytes, read time and tokenize time of the processed files
+    by directory prefix, by extension and for the largest individual files.
+    """
+    def __init__(self, depth=2, top_files=20):
+        self.depth = depth  # Number of leading directories forming a directory prefix
+        self.top_files = top_files
+        self.directories = {}  # prefix -> stats
+        self.extensions = {}  # extension -> stats
+        self.files = []  # Min-heap of (tokens, path, stats) of the largest files
+        self.total = self.new_stats()
+
+    @staticmethod
+    def new_stats():
+        """Return empty aggregated statistics."""
+        return {'files': 0, 'tokens': 0, 'bytes': 0, 'read_seconds': 0.0, 'tokenize_seconds': 0.0}
+
+    def add(self, relative_path, ext, tokens, size, read_seconds, tokenize_seconds):
+        """Record one processed file."""
+        parts = Path(relative_path).parts[:-1][:self.depth]
+        prefix = "/".join(parts) if parts else "."
+        for stats in (self.total,
+                      self.directories.setdefault(prefix, self.new_stats()),
+                      self.extensions.setdefault(ext, self.new_stats())):
+            stats['files'] += 1
+            stats['tokens'] += tokens
+            stats['bytes'] += size
+            stats['read_seconds'] += read_seconds
+            stats['tokenize_seconds'] += tokenize_seconds
+
+        # Only the top files are kept, memory does not grow with the tree
+        entry = (tokens, relative_path, {'tokens': tokens, 'bytes': size, 'read_seconds': read_seconds,
+                                         'tokenize_seconds': tokenize_seconds})
+        if len(self.files) < self.top_files:
+            heapq.heappush(self.files, entry)
+        elif self.top_files:
+            heapq.heappushpop(self.files, entry)
+
+    def get_state(self):
+        """Return the aggregated statistics, for checkpoints."""
+        return {
+            'directories': self.directories,
+            'extensions': self.extensions,
+            'files': self.files,
+            'total': self.total,
+        }
+
+    def set_state(self, state):
+        """Restore a state returned by get_state."""
+        self.directories = state['directories']
+        self.extensions = state['extensions']
+        # JSON turns the heap entries into lists
+        self.files = [tuple(entry) for entry in state['files']]
+        self.total = state['total']
+
+    def ranked(self, groups):
+        """Return the groups of a mapping as records sorted by decreasing tokens."""
+        records = []
+        for name, stats in groups.items():
+            share = stats['tokens'] / self.total['tokens'] if self.total['tokens'] else 0
+            records.append({'name': name, **stats, 'token_share': round(share, 4)})
+        return sorted(records, key=lambda record: (-record['tokens'], record['name']))
+
+    def to_dict(self):
+        """Return the report as a JSON-serializable dictionary."""
+        files = {path: stats for _, path, stats in self.files}
+        return {
+            'total': self.total,
+            'directory_depth': self.depth,
+            'directories': self.ranked(self.directories),
+            'extensions': self.ranked(self.extensions),
+            'top_files': self.ranked(files),
+        }
+
+    def format_table(self, report=None):
+        """Return the report as a compact text table, at most top_files rows per section."""
+        report = report or self.to_dict()
+        lines = []
+        header = f"{'tokens':>12} {'share':>6} {'size':>11} {'files':>7} {'read s':>8} {'token s':>8}  name"
+        for title, records in ((f"BY DIRECTORY (depth {self.depth})", report['directories']),
+                               ("BY EXTENSION", report['extensions']),
+                               (f"TOP {self.top_files} FILES", report['top_files'])):
+            lines += ["", title, header]
+            for record in records[:self.top_files]:
+                lines.append(f"{record['tokens']:>12,} {record['token_share']:>6.1%} {format_size(record['bytes']):>11} "
+                             f"{record.get('files', 1):>7,} {record['read_seconds']:>8.2f} "
+                             f"{record['tokenize_seconds']:>8.2f}  {record['name']}")
+        total = report['total']
+        lines += ["", f"TOTAL {total['tokens']:,} tokens, {format_size(total['bytes'])}, {total['files']:,} files, "
+                      f"read {total['read_seconds']:.2f}s, tokenize {total['tokenize_seconds']:.2f}s"]
+        return "\n".join(lines).lstrip("\n") + "\n"
+
+class ShardManifestWriter:
+    """
+    Streams the file blocks of one shard to a JSON Lines manifest, which
+    merge_manifests later packs into the final output files.
+    """
+    def __init__(self, manifest_file, header):
+        self.manifest_file = manifest_file
+        self.temp_file = manifest_file.with_name(f".{manifest_file.name}.tmp")
+        self.file = open(self.temp_file, 'w', encoding='utf-8', newline='\n')
+        self.file.write(json.dumps(dict(header, type="header")) + "\n")
+        self.token_count = 0
+        self.block_count = 0
+
+    def add(self, index, relative_path, path_block, block_token_count):
+        """Append the block of the file at position index of the walk."""
+        record = {"index": index, "path": relative_path, "tokens": block_token_count, "block": path_block}
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.token_count += block_token_count
+        self.block_count += 1
+
+    def close(self):
+        """Finish the manifest and return its output file information."""
+        self.file.close()
+        os.replace(self.temp_file, self.manifest_file)
+        logger.info(f"Created {self.manifest_file} with {self.block_count} blocks and {self.token_count:,} tokens.")
+        return {
+            'filename': str(self.manifest_file),
+            'token_count': self.token_count,
+            'file_size': os.path.getsize(self.manifest_file),
+            'source_file_count': self.block_count
+        }
+
+    def abort(self):
+        """Discard an incomplete manifest."""
+        self.file.close()
+        try:
+            os.remove(self.temp_file)
+        except OSError:
+            pass
+
+def read_manifest(manifest_file):
+    """
+    Read a shard manifest.
+    
+    Args:
+        manifest_file (str): Path of a manifest written by a --shard run
+    
+    Returns:
+        tuple: (header dict, generator of block records in walk order)
+    """
+    f = open(manifest_file, 'r', encoding='utf-8')
+    header = json.loads(f.readline() or "{}")
+    if header.get("type") != "header":
+        f.close()
+        raise ValueError(f"'{manifest_file}' is not a concatext shard manifest")
+
+    def records():
+        with f:
+            for line in f:
+                yield json.loads(line)
+
+    return header, records()
+
+def print_output_files(output_files):
+    """Print the output files and their totals, as in the execution summary."""
+    # Runs with several max_tokens limits write one set of output files per limit, listed set by set
+    limits = sorted({f.get('max_tokens') for f in output_files} - {None})
+    if len(limits) > 1:
+        output_files = sorted(output_files, key=lambda f: f.get('max_tokens') or 0)
+
+    # Output files
+    print(f"\nOUTPUT ({len(output_files)})")
+    for idx, file_info in enumerate(output_files, 1):
+        print(f"  {idx}. {file_info['filename']}")
+        print(f"     - Tokens: {file_info['token_count']:,}")
+        print(f"     - Size: {format_size(file_info['file_size'])}")
+        print(f"     - Source files: {file_info['source_file_count']}")
+    
+    # Totals, for each set of output files
+    for limit in (limits if len(limits) > 1 else [None]):
+        set_files = [f for f in output_files if limit is None or f.get('max_tokens') == limit]
+        total_tokens = sum(f['token_count'] for f in set_files)
+        total_size = sum(f['file_size'] for f in set_files)
+        total_source_files = sum(f['source_file_count'] for f in set_files)  # Calculate total source files
+
+        print(f"\nTOTALS" + (f" (max tokens {limit:,}, {len(set_files)} files)" if limit else ""))
+        print(f"  • Total tokens: {total_tokens:,}")
+        print(f"  • Total output size: {format_size(total_size)}")
+        print(f"  • Total source files: {total_source_files}")  # Display total source files
+
+def merge_manifests(config, manifest_files, output_stream=None):
+    """
+    Pack the blocks of all shard manifests into the final output files,
+    without reading the source tree again.
+    
+    Blocks are merged in walk order, so the output is the same as that of a
+    single unsharded run with the same configuration.
+    
+    Args:
+        config (dict): Configuration providing max_tokens and output_dir
+        manifest_files (list): Paths of the manifests of every shard
+        output_stream (file, optional): Binary stream receiving the chunks instead of output files
+    
+    Returns:
+        list: Information about the generated output files
+    """
+    start_time = time.time()
+    manifests = []
+    try:
+        for manifest_file in manifest_files:
+            manifests.append(read_manifest(manifest_file))
+    except (OSError, ValueError) as e:
+        raise ConcatextError(f"Error: Unable to read manifest: {e}")
+
+    headers = [header for header, _ in manifests]
+    first = headers[0]
+    for header in headers[1:]:
+        for key in ("dir_name", "shards", "shard_method", "file_separator", "separator_tokens", "output_format", "config"):
+            if header.get(key) != first.get(key):
+                difference = "configuration" if key == "config" else f"'{key}'"
+                raise ConcatextError(f"Error: Manifests come from different runs (different {difference}).")
+    shards = sorted(header["shard"] for header in headers)
+    if shards != list(range(1, first["shards"] + 1)):
+        raise ConcatextError(f"Error: Expected the manifests of shards 1 to {first['shards']}, got {shards}.")
+
+    output_dir = Path(config["output_dir"]).resolve()
+    try:
+        output_dir.mkdir(parents=True, exist_ok=True)
+    except Exception as e:
+        raise ConcatextError(f"Failed to create output directory '{output_dir}': {e}")
+
+    if output_stream:
+        writer = StreamWriter(output_stream, **stream_options(config))
+    else:
+        writer = ChunkWriter()
+    # Blocks were formatted for the output format of the shard runs
+    assemblers = create_assemblers(chunking_options(config), writer, output_dir, first["dir_name"],
+                                   first.get("output_format", "text"), first["file_separator"], first["separator_tokens"])
+    try:
+        # Each manifest is already in walk order, a k-way merge keeps memory bounded
+        records = heapq.merge(*(records for _, records in manifests), key=lambda record: record["index"])
+        for record in records:
+            for assembler in assemblers:
+                assembler.add_block(record["block"], record["tokens"], record["path"])
+        for assembler in assemblers:
+            assembler.save_current_content()
+    finally:
+        writer.close()
+
+    print("\n" + "="*80)
+    print(f"{'CONCATEXT MERGE SUMMARY':^80}")
+    print("="*80)
+    print(f"\nINFORMATION")
+    print(f"  • Execution time: {time.time() - start_time:.2f} seconds")
+    print(f"  • Directory name: {first['dir_name']}")
+    print(f"  • Max tokens / file: {', '.join(f'{limit:,}' for limit in max_token_limits(config))}")
+    print(f"  • Merged shards: {len(manifests)}")
+    print_output_files(writer.output_files)
+    print("\n" + "="*80 + "\n")
+    if output_stream and writer.broken:
+        raise ConcatextError("Error: The output stream was closed before all chunks were written.")
+    return writer.output_files
+
+@functools.lru_cache(maxsize=32)
+def compile_obscured_patterns(obscured_items):
+    """
+    Compile the whole-word patterns of an obscured words mapping.
+    
+    Cached, so that repeated jobs in one process (see serve) reuse the compiled patterns.
+    
+    Args:
+        obscured_items (tuple): (word, placeholder) pairs, in replacement order
+    
+    Returns:
+        list: (compiled pattern, placeholder) pairs
+    """
+    patterns = []
+    for word, placeholder in obscured_items:
+        # Create a regex that matches the word as a whole word
+        pattern = re.compile(r'\b' + re.escape(word) + r'\b')
+        patterns.append((pattern, placeholder))
+    return patterns
+
+def max_token_limits(config):
+    """
+    Read the max_tokens setting of a configuration as a list of limits.
+    
+    max_tokens is either a single limit or a list of limits. Every limit gets its
+    own set of output files, all built from the same pass over the tree.
+    
+    Args:
+        config (dict): Configuration with max_tokens
+    
+    Returns:
+        list: Distinct limits, in configuration order
+    """
+    max_tokens = config["max_tokens"]
+    limits = max_tokens if isinstance(max_tokens, list) else [max_tokens]
+    if not limits or not all(isinstance(limit, int) and limit > 0 for limit in limits):
+        raise ConcatextError("Error: max_tokens must be a positive integer or a list of positive integers.")
+    return list(dict.fromkeys(limits))
+
+def create_assemblers(chunking, writer, output_dir, dir_name, output_format, file_separator, separator_token_count):
+    """
+    Create one chunk assembler per max_tokens limit, all handing output files to one writer.
+    
+    With a single limit output files are named <dir_name>_NN as usual,
+    with several limits every set is named <dir_name>_<limit>_NN.
+    
+    Args:
+        chunking (dict): Boundary options per limit, as returned by chunking_options
+        writer (ChunkWriter): Writer shared by the assemblers
+        output_dir (Path): Directory of the output files
+        dir_name (str): Name of the processed directory
+        output_format (str): Key of OUTPUT_ASSEMBLERS
+        file_separator (str): Separator between file blocks
+        separator_token_count (int): Token count of file_separator
+    
+    Returns:
+        list: Assemblers, in the order of the limits
+    """
+    assembler_class = OUTPUT_ASSEMBLERS[output_format]
+    return [assembler_class(writer, output_dir, dir_name, limit, file_separator, separator_token_count,
+                            name_prefix=f"{dir_name}_{limit}" if len(chunking) > 1 else None, **options)
+            for limit, options in chunking.items()]
+
+def chunking_options(config):
+    """
+    Read the output file boundary options of a configuration, for each max_tokens limit.
+    
+    Args:
+        config (dict): Configuration with max_tokens and the optional chunking keys
+    
+    Returns:
+        dict: Keyword arguments for ChunkAssembler, by limit
+    """
+    chunking = config.get("chunking", "greedy")
+    if chunking not in CHUNKING_MODES:
+        raise ConcatextError(f"Error: Unknown chunking '{chunking}', expected one of: {', '.join(CHUNKING_MODES)}.")
+    options = {}
+    for max_tokens in max_token_limits(config):
+        min_tokens = config.get("chunk_min_tokens", max_tokens // 2)
+        target_tokens = config.get("chunk_target_tokens", (min_tokens + max_tokens) // 2)
+        if chunking == "content_defined" and not 0 <= min_tokens < target_tokens <= max_tokens:
+            raise ConcatextError("Error: Content-defined chunking needs chunk_min_tokens < chunk_target_tokens <= max_tokens "
+                                 f"(max_tokens {max_tokens:,}).")
+        options[max_tokens] = {'chunking': chunking, 'min_tokens': min_tokens, 'target_tokens': target_tokens}
+    return options
+
+def load_config(config_path='config.yaml', override_dir_path=None, require_dir_path=True):
     """
     Load configuration from a YAML file.
     
     Args:
         config_path (str): Path to the configuration file
         override_dir_path (str, optional): If specified, overrides the dir_path from the config file
+        require_dir_path (bool): Exit when no dir_path is configured (not needed to merge manifests)
     
     Returns:
         dict: The loaded configuration
@@ -83,11 +967,9 @@ def load_config(config_path='config.yaml', override_dir_path=None):
             config = yaml.safe_load(config_file)
             logger.info(f"Configuration loaded from '{config_path}'")
     except FileNotFoundError:
-        logger.error(f"Error: Configuration file '{config_path}' not found.")
-        exit(1)
+        raise ConcatextError(f"Error: Configuration file '{config_path}' not found.")
     except yaml.YAMLError as e:
-        logger.error(f"Error parsing YAML file: {e}")
-        exit(1)
+        raise ConcatextError(f"Error parsing YAML file: {e}")
     
     # If a directory path was specified from the command line, use it
     if override_dir_path:
@@ -95,11 +977,10 @@ def load_config(config_path='config.yaml', override_dir_path=None):
         logger.info(f"Using directory path from command line: {override_dir_path}")
     
     # Check required parameters
-    if "dir_path" not in config:
-        logger.error("Error: 'dir_path' not specified. Please provide an input directory path either:\n"
-                     "1. As a command line argument: ./concatext.py /path/to/directory\n"
-                     "2. In the config.yaml file: dir_path: \"/path/to/directory\"")
-        exit(1)
+    if require_dir_path and "dir_path" not in config:
+        raise ConcatextError("Error: 'dir_path' not specified. Please provide an input directory path either:\n"
+                             "1. As a command line argument: ./concatext.py /path/to/directory\n"
+                             "2. In the config.yaml file: dir_path: \"/path/to/directory\"")
     
     # Set default values if missing
     if "max_tokens" not in config:
@@ -126,24 +1007,37 @@ def load_config(config_path='config.yaml', override_dir_path=None):
 
 
 class DirContentProcessor:
-    def __init__(self, config):
+    def __init__(self, config, progress_callback=None, cancel_event=None, output_stream=None, logger=None):
+        # Per-instance logger, so concurrent jobs (see serve) can be told apart
+        self.logger = logger or logging.getLogger('concatext')
         self.dir_path = Path(config["dir_path"]).resolve()
-        self.content = ""
-        self.file_counter = 1
-        self.current_token_count = 0
-        self.current_source_files = 0  # Counter for source files in the current output file
-        self.MAX_TOKENS = config["max_tokens"]
+        self.token_limits = max_token_limits(config)  # max_tokens, one set of output files per limit
         self.non_text_files_count = 0  # Counter for non-text files
         self.start_time = time.time()
         self.output_files = []  # Tracks generated output files
+        self.writer = None  # Background ChunkWriter, running during process_dir
+        self.assemblers = []  # ChunkAssemblers packing blocks into output files during process_dir, one per limit
+        self.ignored_files_count = 0
+        self.ignored_dirs_count = 0
+        
+        # Optional progress reporting: called as progress_callback(files_done, bytes_done)
+        self.progress_callback = progress_callback
+        # Setting this event stops the walk after the current file
+        self.cancel_event = cancel_event or threading.Event()
+        self.cancelled = False
+        # Binary stream receiving the output files as framed chunks (--stdout), instead of output_dir
+        self.output_stream = output_stream
+        self.stream_options = stream_options(config) if output_stream else None
+        
+        # Number of files per extension tokenized by estimate_dir
+        self.estimate_sample_files = config.get("estimate_sample_files", 30)
         
         # Set the output directory and ensure it exists
         self.output_dir = Path(config["output_dir"]).resolve()
         try:
             self.output_dir.mkdir(parents=True, exist_ok=True)
         except Exception as e:
-            logger.error(f"Failed to create output directory '{self.output_dir}': {e}")
-            exit(1)
+            raise ConcatextError(f"Failed to create output directory '{self.output_dir}': {e}")
 
         # Get the directory name for output file naming
         self.dir_name = self.dir_path.name
@@ -152,11 +1046,107 @@ class DirContentProcessor:
         self.ignore_dirs = set(config["ignore_dirs"])
         self.ignore_patterns = set(config["ignore_patterns"])
 
+        # Order in which files are visited, anything but "filesystem" is identical on every host
+        self.ordering = config.get("ordering", "filesystem")
+        if self.ordering not in ORDERING_MODES:
+            raise ConcatextError(f"Error: Unknown ordering '{self.ordering}', expected one of: {', '.join(ORDERING_MODES)}.")
+        # Patterns visited first among the entries of each directory, in list order
+        self.ordering_priority = config.get("ordering_priority", [])
+
+        # Per-pattern token caps: only the head and tail of larger files are kept
+        self.file_token_limits = config.get("file_token_limits") or {}
+        self.truncation_marker = config.get("truncation_marker", "[... {bytes} bytes truncated ...]")
+        self.truncated_files_count = 0
+
+        # Periodic checkpoints allow an interrupted run to be resumed with --resume
+        self.checkpoint_interval = config.get("checkpoint_interval", 1000)
+        self.checkpoint_file = self.output_dir / f".{self.dir_name}_checkpoint.json"
+        self.config_fingerprint = hashlib.sha256(
+            json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        # Shards can only be merged when they read and formatted files the same way
+        self.shard_fingerprint = hashlib.sha256(json.dumps(
+            {key: value for key, value in config.items() if key not in SHARD_LOCAL_KEYS},
+            sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+        # Placement of output file boundaries for each limit, passed to the ChunkAssemblers
+        self.chunking = chunking_options(config)
+
+        # Diff mode: only files changed since a git revision or a previous file manifest are processed
+        self.changed_since = config.get("changed_since")
+        self.changed_files = None  # Relative paths reported by git
+        self.previous_manifest = None  # Relative path -> fingerprint, from the previous file manifest
+        self.unchanged_files_count = 0
+        # File manifest (size, mtime and hash of every file) written by complete runs, for later diffs
+        self.file_manifest = config.get("file_manifest", False)
+        self.file_manifest_path = self.output_dir / f"{self.dir_name}_manifest.json"
+        self.manifest_entries = {}
+
+        # Token budget mode: only the highest-priority files fitting total_token_budget are processed
+        self.total_token_budget = config.get("total_token_budget") or 0
+        self.budget_priority = config.get("budget_priority", ["explicit", "patterns", "smallest"])
+        unknown_rules = [rule for rule in self.budget_priority if rule not in BUDGET_RULES]
+        if unknown_rules:
+            raise ConcatextError(f"Error: Unknown budget_priority rules {unknown_rules}, "
+                                 f"expected some of: {', '.join(BUDGET_RULES)}.")
+        self.budget_patterns = config.get("budget_patterns", [])
+        # Explicit list: relative path ("/" separated) -> rank
+        self.budget_file_ranks = {}
+        for rank, path in enumerate(config.get("budget_files", [])):
+            self.budget_file_ranks.setdefault(Path(path).as_posix(), rank)
+        self.budget_files = None  # Files selected by select_budget_files, in priority order
+        self.budget_used = 0
+        self.over_budget_files_count = 0
+
+        # Optional report of where the tokens come from, written next to the output files
+        self.hotspots = None
+        if config.get("hotspot_report", False):
+            self.hotspots = HotspotReport(config.get("hotspot_depth", 2), config.get("hotspot_top_files", 20))
+
+        # Sharding: "i/N" processes only shard i of N and writes a manifest for merge_manifests
+        self.shard = None
+        self.shard_method = config.get("shard_method", "hash")
+        if config.get("shard"):
+            match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d+)\s*', str(config["shard"]))
+            if not match or not 1 <= int(match.group(1)) <= int(match.group(2)):
+                raise ConcatextError(f"Error: Invalid shard '{config['shard']}', expected 'i/N' with 1 <= i <= N.")
+            self.shard = (int(match.group(1)), int(match.group(2)))
+            if self.ordering == "filesystem":
+                raise ConcatextError("Error: Sharding needs a deterministic ordering, set ordering to 'sorted' or 'grouped'.")
+            if self.shard_method not in SHARD_METHODS:
+                raise ConcatextError(f"Error: Unknown shard_method '{self.shard_method}', expected one of: {', '.join(SHARD_METHODS)}.")
+            # Each shard would select its own files against the whole budget
+            if self.total_token_budget:
+                raise ConcatextError("Error: total_token_budget cannot be combined with sharding.")
+
+        # Content compaction stage, runs before obscuring and token counting
+        self.compaction = {**DEFAULT_COMPACTION, **(config.get("compaction") or {})}
+        self.compaction_stats = {}  # extension -> [bytes before, bytes after]
+
+        # Jupyter notebooks are reduced to their cells, without embedded images
+        self.notebooks = {**DEFAULT_NOTEBOOKS, **(config.get("notebooks") or {})}
+        self.notebook_stats = [0, 0, 0]  # [notebooks, bytes before, bytes after]
+
+        # Generated, minified and lockfile content detected before the full read
+        self.generated_files = {**DEFAULT_GENERATED_FILES, **(config.get("generated_files") or {})}
+        if self.generated_files["action"] not in GENERATED_FILE_ACTIONS:
+            raise ConcatextError(f"Error: Unknown generated_files action '{self.generated_files['action']}', "
+                                 f"expected one of: {', '.join(GENERATED_FILE_ACTIONS)}.")
+        self.generated_file_decisions = []  # [relative path, reason] of every detected file
+
         # Store the file template
         self.file_template = config["file_template"]
         
         # Store the file separator
         self.file_separator = config["file_separator"]
+
+        # JSON Lines records hold the bare content, without template or separator
+        self.output_format = config.get("output_format", "text")
+        if self.output_format not in OUTPUT_ASSEMBLERS:
+            raise ConcatextError(f"Error: Unknown output_format '{self.output_format}', "
+                                 f"expected one of: {', '.join(OUTPUT_ASSEMBLERS)}.")
+        if self.output_format == "jsonl":
+            self.file_template = "{content}"
+            self.file_separator = ""
         
         # Configuration for non-text files
         self.include_non_text_files = config["include_non_text_files"]
@@ -164,12 +1154,28 @@ class DirContentProcessor:
         
         # Configuration for obscured words
         self.obscured_words = config.get("obscured_words", {})
-        # Compile regex patterns for word replacements (only once for efficiency)
-        self.obscured_patterns = []
-        for word, placeholder in self.obscured_words.items():
-            # Create a regex that matches the word as a whole word
-            pattern = re.compile(r'\b' + re.escape(word) + r'\b')
-            self.obscured_patterns.append((pattern, placeholder))
+        # Compiled regex patterns for word replacements, shared by every processor with the same words
+        self.obscured_patterns = compile_obscured_patterns(tuple(self.obscured_words.items()))
+
+        # Tokenizer mode: "nltk" counts exactly, "nltk_lines" counts line by line through a cache,
+        # "approximate" uses calibrated bytes-per-token ratios
+        self.tokenizer = config.get("tokenizer", "nltk")
+        if self.tokenizer not in TOKENIZER_MODES:
+            raise ConcatextError(f"Error: Unknown tokenizer '{self.tokenizer}', expected one of: {', '.join(TOKENIZER_MODES)}.")
+        # Bounded LRU cache of token counts keyed on the line text, for "nltk_lines"
+        self.line_cache = OrderedDict()
+        self.line_cache_size = config.get("line_cache_size", 100000)
+        self.line_cache_stats = {'lines': 0, 'hits': 0, 'tokenizer_calls': 0}
+        self.approximate_token_margin = config.get("approximate_token_margin", 0.1)
+        self.default_bytes_per_token = config.get("default_bytes_per_token", 3.0)
+        
+        # Bytes-per-token ratios per extension, learned from exact counts and kept across runs
+        ratios_file = config.get("token_ratios_file") or f"{self.dir_path.name}_token_ratios.json"
+        self.token_ratios_file = self.output_dir / ratios_file
+        self.ratio_history = self.load_token_ratios()  # extension -> {"bytes", "tokens"}
+        self.token_ratios = {ext: entry["bytes"] / entry["tokens"]
+                             for ext, entry in self.ratio_history.items() if entry.get("tokens")}
+        self.ratio_samples = {}  # extension -> [bytes, tokens] observed during this run
 
     def format_file_block(self, relative_path, file_content):
         """Returns a formatted text block using the template from config."""
@@ -195,98 +1201,477 @@ class DirContentProcessor:
             
         return result
 
-    def count_tokens(self, text):
+    def strip_comments(self, text, style):
+        """Remove the comments of a comment style, keeping string literals intact."""
+        return COMMENT_PATTERNS[style].sub(
+            lambda match: "" if match.group("comment") is not None else match.group(0), text)
+
+    def strip_license(self, text, style):
+        """Remove the first comment of the file when it looks like a license banner."""
+        shebang = ""
+        if text.startswith("#!"):
+            shebang, _, text = text.partition("\n")
+            shebang += "\n"
+
+        # Collect the leading comments, up to the first line of code
+        pattern = COMMENT_PATTERNS[style]
+        position = 0
+        while True:
+            match = pattern.match(text, LEADING_WHITESPACE.match(text, position).end())
+            if not match or match.group("comment") is None:
+                break
+            position = match.end()
+
+        if position and LICENSE_KEYWORDS.search(text[:position]):
+            text = text[position:].lstrip("\n")
+        return shebang + text
+
+    def compact_content(self, text, ext):
+        """
+        Reduce the tokens of file content: strip comments and license banners of
+        recognized languages, trailing whitespace, blank line runs and indentation.
+        """
+        options = self.compaction
+        original_size = len(text.encode('utf-8'))
+        style = EXTENSION_COMMENT_STYLES.get(ext)
+
+        if style:
+            if options["strip_comments"]:
+                text = self.strip_comments(text, style)
+            elif options["strip_license"]:
+                text = self.strip_license(text, style)
+
+        lines = text.split("\n")
+        if options["strip_trailing_whitespace"]:
+            lines = [line.rstrip() for line in lines]
+        if options["reindent"]:
+            # Dividing by the greatest common indentation keeps every nesting level distinct
+            widths = [len(line) - len(line.lstrip(" ")) for line in lines if line.strip()]
+            unit = math.gcd(*widths) if widths else 0
+            if unit > 1:
+                lines = [" " * ((len(line) - len(line.lstrip(" "))) // unit) + line.lstrip(" ")
+                         for line in lines]
+        if options["collapse_blank_lines"]:
+            compacted = []
+            for line in lines:
+                if line.strip() or (compacted and compacted[-1].strip()):
+                    compacted.append(line)
+            lines = compacted
+        text = "\n".join(lines).strip("\n")
+
+        stats = self.compaction_stats.setdefault(ext, [0, 0])
+        stats[0] += original_size
+        stats[1] += len(text.encode('utf-8'))
+        return text
+
+    def transform_content(self, file_path, file_content):
+        """Apply compaction and word obscuring to the content read from a file."""
+        if self.compaction["enabled"]:
+            file_content = self.compact_content(file_content, file_extension(file_path))
+
+        # Apply word obscuring if configured
+        return self.apply_obscured_words(file_content)
+
+    def count_nltk_tokens(self, text):
         """Count tokens in text using NLTK tokenizer."""
         return len(word_tokenize(text, language='english', preserve_line=True))
 
-    def save_current_content(self):
-        """Save accumulated content to a text file and reset the buffer."""
-        if self.content.strip():
-            # Format the counter with at least 2 digits
-            counter_str = f"{self.file_counter:02d}"
-            output_file = self.output_dir / f'{self.dir_name}_{counter_str}.txt'
-            
-            try:
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    f.write(self.content.rstrip() + "\n")
-                
-                # Get file size
-                file_size = os.path.getsize(output_file)
-                
-                # Store output file info
-                self.output_files.append({
-                    'filename': str(output_file),
-                    'token_count': self.current_token_count,
-                    'file_size': file_size,
-                    'source_file_count': self.current_source_files  # Store the count
-                })
-                
-                logger.info(f"Created {output_file} with {self.current_token_count:,} tokens from {self.current_source_files} files.")
-                self.file_counter += 1
-                self.content = ""
-                self.current_token_count = 0
-                self.current_source_files = 0  # Reset the source file counter
-            except IOError as e:
-                logger.error(f"Error writing to file {output_file}: {e}")
-
-    def process_file(self, file_path):
-        """Read and add file content, respecting the token limit."""
+    def count_line_tokens(self, text):
+        """
+        Count tokens line by line through the line cache.
+        
+        Lines missing from the cache are tokenized together in a single NLTK call,
+        separated by sentinel lines, so each line is always counted as if it were in
+        the middle of a text and the result does not depend on the cache state.
+        
+        The sum equals whole-text tokenization except where NLTK rules look across
+        lines. The rule that matters is the final period, split off the last word only
+        at the end of the whole text: in "Hello world.\nNext line." (5 tokens) the
+        lines count "world." and "line." as single tokens, so the final period is
+        added back here. A rule matching across a newline can still make a rare line
+        differ by a token, e.g. a quote opening a line: 'He said "hi" to\n"me".' is 10
+        tokens as a whole and 11 line by line (see tests/test_line_tokens.py). On NLTK's
+        own sources both methods give identical totals.
+        """
+        if LINE_SENTINEL in text:
+            return self.count_nltk_tokens(text)
+
+        cache = self.line_cache
+        lines = text.split("\n")
+        missing = [line for line in dict.fromkeys(lines) if line.strip() and line not in cache]
+
+        new_counts = {}
+        if missing:
+            separator = f"\n{LINE_SENTINEL}\n"
+            tokens = word_tokenize(separator + separator.join(missing) + separator,
+                                   language='english', preserve_line=True)
+            counts = [0]
+            for token in tokens[1:-1]:
+                if token == LINE_SENTINEL:
+                    counts.append(0)
+                else:
+                    counts[-1] += 1
+            new_counts = dict(zip(missing, counts))
+            self.line_cache_stats['tokenizer_calls'] += 1
+
+        total = 0
+        for line in lines:
+            count = new_counts.get(line)
+            if count is None:
+                if not line.strip():
+                    continue
+                count = cache[line]
+                cache.move_to_end(line)
+                self.line_cache_stats['hits'] += 1
+            total += count
+            self.line_cache_stats['lines'] += 1
+
+        # Store the new lines, evicting the least recently used ones
+        cache.update(new_counts)
+        while len(cache) > self.line_cache_size:
+            cache.popitem(last=False)
+
+        if FINAL_PERIOD.search(text):
+            total += 1
+        return total
+
+    def count_tokens(self, text, ext=None):
+        """Count tokens in text with the configured tokenizer mode."""
+        if self.tokenizer == "approximate":
+            ratio = self.token_ratios.get(ext, self.default_bytes_per_token)
+            size = len(text.encode('utf-8'))
+            return math.ceil(size / ratio * (1 + self.approximate_token_margin))
+        if self.tokenizer == "nltk_lines":
+            return self.count_line_tokens(text)
+        return self.count_nltk_tokens(text)
+
+    def record_token_ratio(self, ext, text, token_count):
+        """Record an exact token count to calibrate the bytes-per-token ratio of an extension."""
+        if self.tokenizer == "approximate" or not token_count:
+            return
+        sample = self.ratio_samples.setdefault(ext, [0, 0])
+        sample[0] += len(text.encode('utf-8'))
+        sample[1] += token_count
+
+    def load_token_ratios(self):
+        """Load the byte and token totals per extension observed by previous runs."""
+        try:
+            with open(self.token_ratios_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            if self.tokenizer == "approximate":
+                self.logger.warning(f"No token ratios found at '{self.token_ratios_file}', "
+                               f"using {self.default_bytes_per_token} bytes per token")
+            return {}
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Failed to load token ratios from '{self.token_ratios_file}': {e}")
+            return {}
+
+        return data.get("extensions", {})
+
+    def save_token_ratios(self):
+        """Merge the ratios observed in this run into the ratios file."""
+        if not self.ratio_samples:
+            return
+
+        history = dict(self.ratio_history)
+        for ext, (size, tokens) in self.ratio_samples.items():
+            entry = history.get(ext, {"bytes": 0, "tokens": 0})
+            size += entry["bytes"]
+            tokens += entry["tokens"]
+            # Scale old observations down so recent runs keep a meaningful weight
+            if size > RATIO_HISTORY_BYTES:
+                scale = RATIO_HISTORY_BYTES / size
+                size, tokens = size * scale, tokens * scale
+            history[ext] = {"bytes": size, "tokens": tokens}
+
+        try:
+            data = json.dumps({"extensions": history}, indent=2, sort_keys=True)
+            write_atomic(self.token_ratios_file, data.encode('utf-8'))
+            self.logger.info(f"Token ratios saved to {self.token_ratios_file}")
+        except OSError as e:
+            self.logger.warning(f"Failed to save token ratios to '{self.token_ratios_file}': {e}")
+
+    def file_token_limit(self, file_path):
+        """Return the token cap of the first matching file_token_limits pattern, or None."""
+        relative_path = self.relative_name(file_path)
+        for pattern, limit in self.file_token_limits.items():
+            if fnmatch.fnmatch(relative_path, pattern) or fnmatch.fnmatch(file_path.name, pattern):
+                return limit
+        return None
+
+    def fit_lines(self, lines, budget, ext, from_end=False):
+        """Return the longest run of lines from the start (or end) that fits in budget tokens."""
+        low, high = 0, len(lines)
+        # Binary search on the number of lines kept: O(log n) tokenizer calls
+        while low < high:
+            middle = (low + high + 1) // 2
+            kept = lines[-middle:] if from_end else lines[:middle]
+            if self.count_tokens("\n".join(kept), ext) <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        if not low:
+            return []
+        return lines[-low:] if from_end else lines[:low]
+
+    def read_truncated(self, file_path, limit):
+        """
+        Read a file keeping only as much of its head and tail as fits in limit tokens.
+        
+        Large files are read with two bounded reads at both ends, the middle
+        is never read, and a truncation marker replaces the omitted part.
+        
+        Args:
+            file_path (Path): File to read
+            limit (int): Maximum number of tokens for the file content
+        
+        Returns:
+            str: The (possibly truncated) file content
+        """
+        ext = file_extension(file_path)
+        bytes_per_token = self.token_ratios.get(ext, self.default_bytes_per_token)
+        part_size = max(int(limit / 2 * bytes_per_token * TRUNCATION_READ_FACTOR), 1)
+
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= 2 * part_size:
+                head = f.read()
+                tail = b""
+            else:
+                head = f.read(part_size)
+                f.seek(size - part_size)
+                tail = f.read(part_size)
+                # Only keep complete lines, which also avoids splitting UTF-8 sequences;
+                # a window within a single long line is cut at a character boundary instead
+                if b"\n" in head:
+                    head = head[:head.rfind(b"\n") + 1]
+                else:
+                    head = trim_partial_character(head, at_end=True)
+                if b"\n" in tail:
+                    tail = tail[tail.find(b"\n") + 1:]
+                else:
+                    tail = trim_partial_character(tail, at_end=False)
+
+        def decode(data):
+            # Same newline handling as reading in text mode
+            return data.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+        head_text = decode(head).rstrip()
+        tail_text = decode(tail).rstrip()
+        if not tail and self.count_tokens(head_text, ext) <= limit:
+            return head_text
+
+        self.truncated_files_count += 1
+        head_lines = head_text.split('\n')
+        tail_lines = tail_text.split('\n') if tail else []
+        marker_tokens = self.count_tokens(self.truncation_marker.replace("{bytes}", str(size)), ext)
+        budget = max(limit - marker_tokens, 0)
+
+        kept_head = self.fit_lines(head_lines, budget // 2, ext)
+        if not tail:
+            # Everything was read: the tail comes from the lines after the head
+            tail_lines = head_lines[len(kept_head):]
+        head_text = "\n".join(kept_head)
+        kept_tail = self.fit_lines(tail_lines, budget - self.count_tokens(head_text, ext), ext, from_end=True)
+        tail_text = "\n".join(kept_tail)
+
+        omitted = size - len(head_text.encode('utf-8')) - len(tail_text.encode('utf-8'))
+        marker = self.truncation_marker.replace("{bytes}", str(max(omitted, 0)))
+        self.logger.info(f"Truncated {self.relative_name(file_path)} to the first {len(kept_head)} "
+                    f"and last {len(kept_tail)} lines")
+        return "\n".join(part for part in (head_text, marker, tail_text) if part)
+
+    def read_notebook(self, file_path):
+        """
+        Extract the cells of a Jupyter notebook in the "# %%" cell format.
+        
+        Only cell sources are kept, plus the short text outputs of code cells when
+        enabled; images and other rich outputs are dropped. With ijson installed the
+        notebook is parsed cell by cell, so a single cell is held in memory at a time.
+        
+        Args:
+            file_path (Path): Notebook to read
+        
+        Returns:
+            str: The extracted cells, or None if the file is not a valid notebook
+        """
         try:
+            content, size = self.extract_notebook(file_path)
+        except NOTEBOOK_ERRORS as e:
+            self.logger.warning(f"Reading {file_path} as text, not a valid notebook: {e}")
+            return None
+
+        self.notebook_stats[0] += 1
+        self.notebook_stats[1] += size
+        self.notebook_stats[2] += len(content.encode('utf-8'))
+        return content
+
+    def extract_notebook(self, file_path):
+        """Return the extracted cells of a notebook and its size, raising one of NOTEBOOK_ERRORS if it is not valid."""
+        parts = []
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if ijson:
+                cells = ijson.items(f, 'cells.item')
+            else:
+                document = json.load(f)
+                if not isinstance(document, dict):
+                    raise ValueError("the document is not a JSON object")
+                cells = document.get('cells', [])
+            for cell in cells:
+                if not isinstance(cell, dict):
+                    raise ValueError("a cell is not a JSON object")
+                cell_type = cell.get('cell_type', 'code')
+                header = "# %%" if cell_type == "code" else f"# %% [{cell_type}]"
+                parts.append(f"{header}\n{notebook_text(cell.get('source')).rstrip()}")
+                if self.notebooks["outputs"] and cell_type == "code":
+                    output = self.notebook_output(cell.get('outputs') or [])
+                    if output:
+                        parts.append(f"# Output:\n{output}")
+        # Also the case of JSON documents that are not notebooks, e.g. a top-level list with ijson
+        if not parts:
+            raise ValueError("no cells found")
+        return "\n\n".join(parts), size
+
+    def notebook_output(self, outputs):
+        """Return the text outputs of a notebook code cell, or a note if they are too long."""
+        texts = []
+        for output in outputs:
+            if not isinstance(output, dict):
+                raise ValueError("an output is not a JSON object")
+            output_type = output.get('output_type')
+            if output_type == "stream":
+                texts.append(notebook_text(output.get('text')))
+            elif output_type in ("execute_result", "display_data"):
+                # Images, HTML and other rich data are dropped, plain text is kept when present
+                texts.append(notebook_text((output.get('data') or {}).get('text/plain')))
+            elif output_type == "error":
+                texts.append(f"{output.get('ename', 'Error')}: {output.get('evalue', '')}")
+        text = "\n".join(text.rstrip() for text in texts if text.strip())
+        if len(text) > self.notebooks["max_output_chars"]:
+            return f"[{len(text):,} characters of output omitted]"
+        return text
+
+    def classify_file(self, file_path, by_name_only=False):
+        """
+        Detect generated, minified and lockfile content, reading at most sample_bytes of the file.
+        
+        Known lockfile names and generated file patterns are recognized by name alone;
+        other files are judged on "generated" markers in their first lines and, for
+        MINIFIABLE_EXTENSIONS, on their average line length.
+        
+        Args:
+            file_path (Path): File to classify
+            by_name_only (bool): Only check the file name, without reading the file
+        
+        Returns:
+            str: The reason the file is considered generated, or None for regular files
+        """
+        options = self.generated_files
+        relative_path = self.relative_name(file_path)
+        if any(fnmatch.fnmatch(relative_path, pattern) or fnmatch.fnmatch(file_path.name, pattern)
+               for pattern in options["keep_patterns"]):
+            return None
+
+        if file_path.name in LOCKFILE_NAMES:
+            return "lockfile"
+        for pattern, reason in GENERATED_FILE_PATTERNS.items():
+            if fnmatch.fnmatch(file_path.name, pattern):
+                return reason
+        if by_name_only:
+            return None
+
+        try:
+            with open(file_path, 'rb') as f:
+                sample = f.read(options["sample_bytes"])
+        except OSError:
+            return None  # read_file reports unreadable files
+        if b"\0" in sample:
+            return None  # Binary content is handled as a non-text file
+
+        # The sample may end in the middle of a UTF-8 sequence
+        text = sample.decode('utf-8', errors='ignore')
+        lines = text.split('\n')
+        match = GENERATED_MARKERS.search("\n".join(lines[:GENERATED_MARKER_LINES]))
+        if match:
+            return f"generated marker '{match.group(0).strip()}'"
+        if file_extension(file_path) in MINIFIABLE_EXTENSIONS and len(sample) >= MIN_LINE_LENGTH_SAMPLE:
+            average = len(text) / len(lines)
+            if average > options["max_average_line_length"]:
+                return f"minified, average line length {average:,.0f}"
+        return None
+
+    def read_file(self, file_path):
+        """Read file content, returning the placeholder or None for non-text files."""
+        try:
+            if self.notebooks["enabled"] and file_extension(file_path) == ".ipynb":
+                notebook = self.read_notebook(file_path)
+                if notebook is not None:
+                    return notebook
+            reason = self.classify_file(file_path) if self.generated_files["enabled"] else None
+            if reason:
+                # Generated content is left out before the file is read in full
+                self.generated_file_decisions.append([self.relative_name(file_path), reason])
+                self.logger.info(f"Generated file {file_path}: {reason}")
+                if self.generated_files["action"] == "skip":
+                    return None
+                return self.generated_files["placeholder"].replace("{reason}", reason)
+            limit = self.file_token_limit(file_path) if self.file_token_limits else None
+            if limit is not None:
+                return self.read_truncated(file_path, limit)
             with open(file_path, 'r', encoding='utf-8') as f:
-                file_content = f.read().rstrip()
+                return f.read().rstrip()
         except (UnicodeDecodeError, IOError) as e:
             # Check if we should include non-text files
             if not self.include_non_text_files:
                 # Skip this file completely
                 self.non_text_files_count += 1
-                logger.warning(f"Skipping non-text file {file_path}: {str(e)}")
-                return
+                self.logger.warning(f"Skipping non-text file {file_path}: {str(e)}")
+                return None
                 
             # Include the file with a placeholder message
-            error_message = f"{self.non_text_file_placeholder}"
-            file_content = error_message
             self.non_text_files_count += 1
-            logger.warning(f"Non-text file {file_path}: {str(e)}")
+            self.logger.warning(f"Non-text file {file_path}: {str(e)}")
+            return f"{self.non_text_file_placeholder}"
 
-        # Apply word obscuring if configured
-        file_content = self.apply_obscured_words(file_content)
-
-        relative_path = str(file_path.relative_to(self.dir_path))
-        path_block = self.format_file_block(relative_path, file_content)
+    def build_block(self, file_path):
+        """
+        Read a file and format its block.
         
-        # Add separator if not the first file in the content
-        if self.content and self.file_separator:
-            separator_token_count = self.count_tokens(self.file_separator)
-            # Check if adding separator would exceed limit
-            if self.current_token_count + separator_token_count > self.MAX_TOKENS:
-                self.save_current_content()
-                block_token_count = self.count_tokens(path_block)
-            else:
-                # Add separator and update token count
-                self.content += self.file_separator
-                self.current_token_count += separator_token_count
-                block_token_count = self.count_tokens(path_block)
-        else:
-            block_token_count = self.count_tokens(path_block)
+        Returns:
+            tuple: (relative_path, path_block, block_token_count), or None for skipped files
+        """
+        read_start = time.perf_counter()
+        file_content = self.read_file(file_path)
+        if file_content is None:
+            return None
+        read_seconds = time.perf_counter() - read_start
 
-        # If adding this block exceeds the limit, save and restart
-        if self.current_token_count + block_token_count > self.MAX_TOKENS:
-            self.save_current_content()
+        file_content = self.transform_content(file_path, file_content)
 
-        self.content += path_block
-        self.current_token_count += block_token_count
-        self.current_source_files += 1 # Increment source file counter for this output file
+        relative_path = self.relative_name(file_path)
+        path_block = self.format_file_block(relative_path, file_content)
+        ext = file_extension(file_path)
+        tokenize_start = time.perf_counter()
+        block_token_count = self.count_tokens(path_block, ext)
+        tokenize_seconds = time.perf_counter() - tokenize_start
+        self.record_token_ratio(ext, path_block, block_token_count)
+
+        block = (relative_path, path_block, block_token_count)
+        # Blocks dropped by the token budget never reach the output, nor the hotspot report
+        if self.total_token_budget and self.charge_budget(block) is None:
+            return None
+        if self.hotspots:
+            self.hotspots.add(relative_path, ext, block_token_count, len(path_block.encode('utf-8')),
+                              read_seconds, tokenize_seconds)
+        return block
 
     def print_summary(self, file_count, ignored_files_count, ignored_dirs_count):
         """Print a comprehensive summary of the processing results."""
         end_time = time.time()
         execution_time = end_time - self.start_time
         
-        # Calculate totals
-        total_tokens = sum(f['token_count'] for f in self.output_files)
-        total_size = sum(f['file_size'] for f in self.output_files)
-        total_source_files = sum(f['source_file_count'] for f in self.output_files)  # Calculate total source files
-        
         # Print header
         print("\n" + "="*80)
         print(f"{'CONCATEXT EXECUTION SUMMARY':^80}")
@@ -297,7 +1682,31 @@ class DirContentProcessor:
         print(f"  • Start Time: {datetime.fromtimestamp(self.start_time).strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"  • Execution time: {execution_time:.2f} seconds")
         print(f"  • Directory name: {self.dir_path.name}")
-        print(f"  • Max tokens / file: {self.MAX_TOKENS:,}")
+        print(f"  • Max tokens / file: {', '.join(f'{limit:,}' for limit in self.token_limits)}")
+        if self.tokenizer == "approximate":
+            print(f"  • Tokenizer: approximate (+{self.approximate_token_margin:.0%} margin, "
+                  f"{len(self.token_ratios)} calibrated extensions)")
+        if self.tokenizer == "nltk_lines":
+            stats = self.line_cache_stats
+            hit_rate = stats['hits'] / stats['lines'] if stats['lines'] else 0
+            print(f"  • Tokenizer: nltk_lines ({stats['tokenizer_calls']:,} tokenizer calls for {stats['lines']:,} lines, "
+                  f"{hit_rate:.1%} cache hits)")
+        for assembler in self.assemblers:
+            if assembler.chunking != "content_defined":
+                continue
+            counts = assembler.boundary_counts
+            limit = f" at {assembler.MAX_TOKENS:,} max tokens" if len(self.assemblers) > 1 else ""
+            print(f"  • Chunking{limit}: content-defined ({counts['content']} content boundaries, "
+                  f"{counts['forced']} forced by max tokens)")
+        if self.total_token_budget:
+            print(f"  • Token budget: {self.budget_used:,} of {self.total_token_budget:,} tokens used, "
+                  f"{self.over_budget_files_count} files left out")
+        if self.changed_since:
+            print(f"  • Changed since {self.changed_since}: {self.unchanged_files_count} unchanged files skipped")
+        if self.shard:
+            print(f"  • Shard: {self.shard[0]} of {self.shard[1]} ({self.shard_method}), merge the manifests with --merge")
+        if self.cancelled:
+            print(f"  • Status: cancelled before completion")
         
         # File statistics
         print(f"\nSTATISTICS")
@@ -312,76 +1721,990 @@ class DirContentProcessor:
         if self.obscured_words:
             print(f"  • Words obscured: {len(self.obscured_words)}")
         
-        # Output files
-        print(f"\nOUTPUT ({len(self.output_files)})")
-        for idx, file_info in enumerate(self.output_files, 1):
-            print(f"  {idx}. {file_info['filename']}")
-            print(f"     - Tokens: {file_info['token_count']:,}")
-            print(f"     - Size: {format_size(file_info['file_size'])}")
-            print(f"     - Source files: {file_info['source_file_count']}")
+        # Truncated files statistics
+        if self.file_token_limits:
+            print(f"  • Truncated files: {self.truncated_files_count}")
         
-        # Totals
-        print(f"\nTOTALS")
-        print(f"  • Total tokens: {total_tokens:,}")
-        print(f"  • Total output size: {format_size(total_size)}")
-        print(f"  • Total source files: {total_source_files}")  # Display total source files
+        # Notebooks reduced to their cells
+        notebooks, before, after = self.notebook_stats
+        if notebooks:
+            print(f"  • Notebooks: {notebooks} reduced to their cells, {format_size(before)} -> {format_size(after)}")
+        
+        # Largest token sources, the full report is saved next to the output files
+        if self.hotspots and self.hotspots.directories:
+            top = self.hotspots.ranked(self.hotspots.directories)[0]
+            print(f"  • Top directory: {top['name']} ({top['tokens']:,} tokens, {top['token_share']:.1%}), "
+                  f"see {self.dir_name}_hotspots.txt")
+        
+        # Compaction savings per file type
+        if self.compaction_stats:
+            before_total = sum(before for before, _ in self.compaction_stats.values())
+            after_total = sum(after for _, after in self.compaction_stats.values())
+            print(f"\nCOMPACTION")
+            ranked = sorted(self.compaction_stats.items(), key=lambda item: item[1][0] - item[1][1], reverse=True)
+            for ext, (before, after) in ranked:
+                saved = 1 - after / before if before else 0
+                print(f"  • {ext}: {format_size(before)} -> {format_size(after)} ({saved:.1%} saved)")
+            saved = 1 - after_total / before_total if before_total else 0
+            print(f"  • Total: {format_size(before_total)} -> {format_size(after_total)} ({saved:.1%} saved)")
+        
+        # Generated files and the reason of each decision
+        if self.generated_file_decisions:
+            action = "skipped" if self.generated_files["action"] == "skip" else "replaced by a placeholder"
+            print(f"\nGENERATED FILES ({len(self.generated_file_decisions)} {action})")
+            for relative_path, reason in self.generated_file_decisions:
+                print(f"  • {relative_path}: {reason}")
+        
+        print_output_files(self.output_files)
         
         print("\n" + "="*80)
         print(f"{'END OF CONCATEXT EXECUTION':^80}")
         print("="*80 + "\n")
 
-    def process_dir(self):
-        """Process all files in the directory."""
-        if not self.dir_path.exists():
-            logger.error(f"Error: Directory '{self.dir_path}' does not exist.")
-            exit(1)
+    def cancel(self):
+        """Request a cooperative stop of process_dir after the current file."""
+        self.cancel_event.set()
 
-        logger.info(f"Starting scan of: {self.dir_path}")
-        file_count = 0
-        ignored_files_count = 0
-        ignored_dirs_count = 0
+    def relative_name(self, file_path):
+        """Return the path relative to dir_path as used in output and ignore patterns."""
+        relative_path = file_path.relative_to(self.dir_path)
+        # Deterministic orderings also need host-independent path separators
+        if self.ordering != "filesystem":
+            return relative_path.as_posix()
+        return str(relative_path)
+
+    def is_ignored_file(self, file_path, log_ignored):
+        """Check a file against the ignore patterns, updating the ignored counter."""
+        relative_path = self.relative_name(file_path)
+        if any(fnmatch.fnmatch(relative_path, pattern) for pattern in self.ignore_patterns):
+            self.ignored_files_count += 1
+            if log_ignored:
+                self.logger.info(f"Ignoring file: {relative_path}")
+            return True
+        return False
+
+    def walk_files(self, log_ignored=True):
+        """
+        Yield the paths of all files not excluded by the ignore rules.
+        
+        With ordering "filesystem" files come in os.walk order, which depends on the
+        filesystem. The other modes sort the entries of each directory while walking,
+        so only one directory listing per level is held in memory:
+            sorted   - files and subdirectories interleaved by name (full path order)
+            grouped  - the files of a directory first, then its subdirectories
+        In both modes ordering_priority patterns move matching entries ahead of
+        their siblings.
+        """
+        if self.ordering == "filesystem":
+            yield from self.walk_filesystem_order(log_ignored)
+        else:
+            yield from self.walk_sorted_order(self.dir_path, log_ignored)
 
+    def walk_filesystem_order(self, log_ignored):
+        """Yield files in the order returned by os.walk."""
         for root, dirs, files in os.walk(self.dir_path):
             # Skip ignored directories
             dirs_to_ignore = [d for d in dirs if d in self.ignore_dirs]
-            for d in dirs_to_ignore:
-                logger.info(f"Ignoring directory: {os.path.join(os.path.basename(root), d)}")
+            if log_ignored:
+                for d in dirs_to_ignore:
+                    self.logger.info(f"Ignoring directory: {os.path.join(os.path.basename(root), d)}")
             
             dirs[:] = [d for d in dirs if d not in self.ignore_dirs]
-            ignored_dirs_count += len(dirs_to_ignore)
+            self.ignored_dirs_count += len(dirs_to_ignore)
 
             for file in files:
                 file_path = Path(root) / file
-                relative_path = file_path.relative_to(self.dir_path)
 
                 # Skip files matching ignore patterns
-                if any(fnmatch.fnmatch(str(relative_path), pattern) for pattern in self.ignore_patterns):
-                    ignored_files_count += 1
-                    logger.info(f"Ignoring file: {relative_path}")
+                if not self.is_ignored_file(file_path, log_ignored):
+                    yield file_path
+
+    def entry_sort_key(self, entry, is_dir):
+        """Sort key of a directory entry for the deterministic orderings."""
+        relative_path = self.relative_name(Path(entry.path))
+        # Directories also match patterns written for their content, e.g. "src/*"
+        candidates = (relative_path, relative_path + "/") if is_dir else (relative_path,)
+        priority = len(self.ordering_priority)
+        for index, pattern in enumerate(self.ordering_priority):
+            if any(fnmatch.fnmatch(candidate, pattern) for candidate in candidates):
+                priority = index
+                break
+        group = 1 if self.ordering == "grouped" and is_dir else 0
+        # Normalized names sort the same whatever Unicode form the filesystem returns
+        return (priority, group, unicodedata.normalize('NFC', entry.name))
+
+    def walk_sorted_order(self, directory, log_ignored):
+        """Yield files depth-first, sorting the entries of each directory."""
+        try:
+            with os.scandir(directory) as scanner:
+                entries = [(entry, entry.is_dir()) for entry in scanner]
+        except OSError as e:
+            self.logger.warning(f"Unable to list directory {directory}: {e}")
+            return
+
+        entries.sort(key=lambda item: self.entry_sort_key(*item))
+        for entry, is_dir in entries:
+            if is_dir:
+                if entry.name in self.ignore_dirs:
+                    self.ignored_dirs_count += 1
+                    if log_ignored:
+                        self.logger.info(f"Ignoring directory: {os.path.join(os.path.basename(directory), entry.name)}")
+                # Like os.walk, symbolic links to directories are not followed
+                elif not entry.is_symlink():
+                    yield from self.walk_sorted_order(Path(entry.path), log_ignored)
+                continue
+
+            file_path = Path(entry.path)
+            if not self.is_ignored_file(file_path, log_ignored):
+                yield file_path
+
+    def scan_dir(self):
+        """
+        Quickly count the candidate files and their total size without reading them.
+        
+        Returns:
+            tuple: (file_count, total_bytes)
+        """
+        file_count = 0
+        total_bytes = 0
+        for file_path in self.walk_files(log_ignored=False):
+            file_count += 1
+            try:
+                total_bytes += file_path.stat().st_size
+            except OSError:
+                pass
+        
+        # The scan must not affect the counters of the real run
+        self.ignored_files_count = 0
+        self.ignored_dirs_count = 0
+        return file_count, total_bytes
+
+    def scan_tree(self):
+        """
+        Total the candidate files, their bytes and estimated tokens per directory, without reading them.
+        
+        Tokens are estimated from each file size with the bytes-per-token ratio of its extension.
+        The totals of a directory include its subdirectories. Setting cancel_event stops the scan.
+        
+        Returns:
+            dict: Relative directory path ("" for dir_path, "/" separated) -> {'files', 'bytes', 'tokens'}
+        """
+        tree = {}
+        for file_path in self.walk_files(log_ignored=False):
+            if self.cancel_event.is_set():
+                break
+            try:
+                size = file_path.stat().st_size
+            except OSError:
+                size = 0
+            tokens = size / self.token_ratios.get(file_extension(file_path), self.default_bytes_per_token)
+            
+            # Every ancestor up to dir_path includes the file
+            parts = file_path.parent.relative_to(self.dir_path).parts
+            for depth in range(len(parts) + 1):
+                stats = tree.setdefault("/".join(parts[:depth]), {'files': 0, 'bytes': 0, 'tokens': 0})
+                stats['files'] += 1
+                stats['bytes'] += size
+                stats['tokens'] += tokens
+        
+        for stats in tree.values():
+            stats['tokens'] = round(stats['tokens'])
+        
+        # The scan must not affect the counters of the real run
+        self.ignored_files_count = 0
+        self.ignored_dirs_count = 0
+        return tree
+
+    def estimate_dir(self):
+        """
+        Predict the token total and output file count without a full run.
+        
+        Every candidate file is only stat'ed; a random sample of files per extension
+        is tokenized and a ratio estimator (tokens per byte) extrapolates the total
+        for each extension, with a 95% confidence band.
+        
+        Returns:
+            dict: Estimate with per-extension details, totals and the chunk count range
+        """
+        if not self.dir_path.exists():
+            raise ConcatextError(f"Error: Directory '{self.dir_path}' does not exist.")
+
+        self.logger.info(f"Estimating output for: {self.dir_path}")
+        rng = random.Random(0)  # Fixed seed, repeated estimates give the same numbers
+        extensions = {}
+
+        for file_path in self.walk_files(log_ignored=False):
+            try:
+                size = file_path.stat().st_size
+            except OSError:
+                size = 0
+            ext = file_path.suffix.lower() or "(none)"
+            stats = extensions.setdefault(ext, {'files': 0, 'bytes': 0, 'sample': []})
+            stats['files'] += 1
+            stats['bytes'] += size
+
+            # Reservoir sampling keeps a uniform sample without storing every path
+            if len(stats['sample']) < self.estimate_sample_files:
+                stats['sample'].append((file_path, size))
+            else:
+                index = rng.randrange(stats['files'])
+                if index < self.estimate_sample_files:
+                    stats['sample'][index] = (file_path, size)
+
+        total_tokens = 0.0
+        total_variance = 0.0
+        total_files = 0
+        for ext, stats in extensions.items():
+            sample_tokens = []
+            for file_path, size in stats['sample']:
+                file_content = self.read_file(file_path)
+                if file_content is None:
+                    sample_tokens.append((size, 0))
                     continue
+                file_content = self.transform_content(file_path, file_content)
+                block = self.format_file_block(self.relative_name(file_path), file_content)
+                tokens = self.count_tokens(block, ext)
+                self.record_token_ratio(ext, block, tokens)
+                sample_tokens.append((size, tokens))
 
-                logger.info(f"Processing file: {relative_path}")
-                self.process_file(file_path)
+            n = len(sample_tokens)
+            sample_bytes = sum(size for size, _ in sample_tokens)
+            sample_total = sum(tokens for _, tokens in sample_tokens)
+            if sample_bytes:
+                # Ratio estimator: tokens ~= ratio * bytes
+                ratio = sample_total / sample_bytes
+                estimate = ratio * stats['bytes']
+                residuals = [tokens - ratio * size for size, tokens in sample_tokens]
+                mean_bytes = sample_bytes / n
+                scale = stats['bytes'] / mean_bytes
+            else:
+                # Only empty files were sampled, fall back to the mean per file
+                mean_tokens = sample_total / n
+                estimate = mean_tokens * stats['files']
+                residuals = [tokens - mean_tokens for _, tokens in sample_tokens]
+                scale = stats['files']
+
+            variance = 0.0
+            if n > 1:
+                finite_population = 1 - n / stats['files']
+                variance = scale ** 2 * finite_population * sum(r * r for r in residuals) / ((n - 1) * n)
+
+            stats.update(sampled=n, tokens=estimate, margin=1.96 * math.sqrt(variance))
+            del stats['sample']
+            total_tokens += estimate
+            total_variance += variance
+            total_files += stats['files']
+
+        # Separators are added between consecutive files
+        if total_files > 1 and self.file_separator:
+            total_tokens += self.count_tokens(self.file_separator) * (total_files - 1)
+        margin = 1.96 * math.sqrt(total_variance)
+
+        # Greedy packing leaves on average half a block unused at the end of each output file
+        mean_block = total_tokens / total_files if total_files else 0
+
+        def chunk_count(tokens, max_tokens):
+            capacity = max(max_tokens - mean_block / 2, 1)
+            return max(math.ceil(tokens / capacity), 1 if total_files else 0)
+
+        self.save_token_ratios()
+
+        return {
+            'extensions': extensions,
+            'files': total_files,
+            'tokens': total_tokens,
+            'margin': margin,
+            # Expected output files for each max_tokens limit
+            'chunks': {limit: {
+                'count': chunk_count(total_tokens, limit),
+                'low': chunk_count(max(total_tokens - margin, 0), limit),
+                'high': chunk_count(total_tokens + margin, limit),
+            } for limit in self.token_limits},
+        }
+
+    def print_estimate(self, estimate):
+        """Print the result of estimate_dir."""
+        execution_time = time.time() - self.start_time
+
+        print("\n" + "="*80)
+        print(f"{'CONCATEXT ESTIMATE':^80}")
+        print("="*80)
+
+        print(f"\nINFORMATION")
+        print(f"  • Execution time: {execution_time:.2f} seconds")
+        print(f"  • Directory name: {self.dir_path.name}")
+        print(f"  • Max tokens / file: {', '.join(f'{limit:,}' for limit in self.token_limits)}")
+        print(f"  • Ignored files: {self.ignored_files_count}")
+        print(f"  • Ignored directories: {self.ignored_dirs_count}")
+
+        print(f"\nEXTENSIONS ({len(estimate['extensions'])})")
+        print(f"  {'Extension':<16}{'Files':>10}{'Sampled':>10}{'Size':>14}{'Tokens':>26}")
+        ranked = sorted(estimate['extensions'].items(), key=lambda item: item[1]['tokens'], reverse=True)
+        for ext, stats in ranked:
+            tokens = f"{stats['tokens']:,.0f} ± {stats['margin']:,.0f}"
+            print(f"  {ext:<16}{stats['files']:>10,}{stats['sampled']:>10,}{format_size(stats['bytes']):>14}{tokens:>26}")
+
+        print(f"\nTOTALS")
+        print(f"  • Files: {estimate['files']:,}")
+        print(f"  • Estimated tokens: {estimate['tokens']:,.0f} ± {estimate['margin']:,.0f} (95% confidence)")
+        for limit, chunks in estimate['chunks'].items():
+            label = f" at {limit:,} max tokens" if len(estimate['chunks']) > 1 else ""
+            if chunks['low'] == chunks['high']:
+                print(f"  • Expected output files{label}: {chunks['count']}")
+            else:
+                print(f"  • Expected output files{label}: {chunks['count']} "
+                      f"(between {chunks['low']} and {chunks['high']})")
+
+        print("\n" + "="*80 + "\n")
+
+    def save_checkpoint(self, files_done, bytes_done, last_file):
+        """Save the walk position, finished output files and current output file state."""
+        # The checkpoint may only list output files that are really on disk
+        self.writer.wait()
+        checkpoint = {
+            'config': self.config_fingerprint,
+            'files_done': files_done,
+            'bytes_done': bytes_done,
+            'last_file': last_file,
+            'assemblers': [assembler.get_state() for assembler in self.assemblers],
+            'output_files': self.output_files,
+            'non_text_files_count': self.non_text_files_count,
+            'truncated_files_count': self.truncated_files_count,
+            'compaction_stats': self.compaction_stats,
+            'notebook_stats': self.notebook_stats,
+            'generated_file_decisions': self.generated_file_decisions,
+            'hotspots': self.hotspots.get_state() if self.hotspots else None,
+            'ratio_samples': self.ratio_samples,
+            'budget_used': self.budget_used,
+            'over_budget_files_count': self.over_budget_files_count,
+        }
+        try:
+            write_atomic(self.checkpoint_file, json.dumps(checkpoint).encode('utf-8'))
+        except OSError as e:
+            self.logger.warning(f"Failed to save checkpoint '{self.checkpoint_file}': {e}")
+
+    def load_checkpoint(self):
+        """Restore the state saved by save_checkpoint, returning it or None if there is none."""
+        try:
+            with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            self.logger.warning(f"No checkpoint found at '{self.checkpoint_file}', starting from the beginning.")
+            return None
+        except (OSError, ValueError) as e:
+            raise ConcatextError(f"Error: Unable to read checkpoint '{self.checkpoint_file}': {e}")
+
+        if checkpoint.get('config') != self.config_fingerprint:
+            raise ConcatextError("Error: The configuration changed since the checkpoint was saved, "
+                                 "run without --resume to start over.")
+
+        for assembler, state in zip(self.assemblers, checkpoint['assemblers']):
+            assembler.set_state(state)
+        self.output_files.extend(checkpoint['output_files'])
+        self.non_text_files_count = checkpoint['non_text_files_count']
+        self.truncated_files_count = checkpoint['truncated_files_count']
+        self.compaction_stats = checkpoint['compaction_stats']
+        self.notebook_stats = checkpoint['notebook_stats']
+        self.generated_file_decisions = checkpoint['generated_file_decisions']
+        if self.hotspots:
+            self.hotspots.set_state(checkpoint['hotspots'])
+        self.ratio_samples = checkpoint['ratio_samples']
+        self.budget_used = checkpoint['budget_used']
+        self.over_budget_files_count = checkpoint['over_budget_files_count']
+        self.logger.info(f"Resuming after {checkpoint['files_done']} files ({checkpoint['last_file']})")
+        return checkpoint
+
+    def remove_checkpoint(self):
+        """Delete the checkpoint of a completed run."""
+        try:
+            os.remove(self.checkpoint_file)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.logger.warning(f"Failed to remove checkpoint '{self.checkpoint_file}': {e}")
+
+    def process_dir(self, resume=False, report=True):
+        """
+        Process all files in the directory.
+        
+        Args:
+            resume (bool): Continue from the checkpoint of an interrupted run
+            report (bool): Print the execution summary at the end
+        """
+        if not self.dir_path.exists():
+            raise ConcatextError(f"Error: Directory '{self.dir_path}' does not exist.")
+
+        if self.shard and resume:
+            raise ConcatextError("Error: Shard runs do not write checkpoints, rerun the shard without --resume.")
+        if self.output_stream and resume:
+            raise ConcatextError("Error: Streamed chunks cannot be rewritten, --resume only works with output files.")
+
+        if self.changed_since:
+            self.load_changed_files()
+        if self.total_token_budget:
+            self.budget_files = self.select_budget_files()
+
+        self.logger.info(f"Starting scan of: {self.dir_path}")
+        file_count = 0
+        bytes_done = 0
+        last_file = None
+        # Shard runs are short-lived by design and are simply rerun, and streamed chunks
+        # cannot be taken back by a resumed run: neither writes checkpoints
+        checkpoint_interval = 0 if self.shard or self.output_stream else self.checkpoint_interval
+
+        # Output files are written by a background thread
+        if self.output_stream:
+            self.writer = StreamWriter(self.output_stream, cancel_event=self.cancel_event,
+                                       logger=self.logger, **self.stream_options)
+        else:
+            self.writer = ChunkWriter(logger=self.logger)
+        self.output_files = self.writer.output_files
+        separator_token_count = self.count_tokens(self.file_separator) if self.file_separator else 0
+        # Every block is read and tokenized once, then packed by the assembler of each limit
+        self.assemblers = create_assemblers(self.chunking, self.writer, self.output_dir, self.dir_name,
+                                            self.output_format, self.file_separator, separator_token_count)
+        manifest = None
+        total_files = None
+        if self.shard:
+            if self.shard_method == "range":
+                total_files = self.scan_dir()[0]
+            manifest = self.open_shard_manifest(separator_token_count)
+        try:
+            skip_files = 0
+            if resume:
+                checkpoint = self.load_checkpoint()
+                if checkpoint:
+                    skip_files = checkpoint['files_done']
+                    bytes_done = checkpoint['bytes_done']
+                    last_file = checkpoint['last_file']
+
+            # In token budget mode the selected files come in priority order
+            files = self.walk_files() if self.budget_files is None else iter(self.budget_files)
+            for index, file_path in enumerate(files):
+                relative_path = self.relative_name(file_path)
+                if self.shard and not self.in_shard(index, relative_path, total_files):
+                    continue
+                if (self.changed_since or self.file_manifest) and not self.track_file(file_path, relative_path):
+                    self.unchanged_files_count += 1
+                    continue
+
+                # Files before the checkpoint are only walked, not read
+                if file_count < skip_files:
+                    file_count += 1
+                    if file_count == skip_files and self.relative_name(file_path) != last_file:
+                        raise ConcatextError(f"Error: The directory changed since the checkpoint was saved "
+                                             f"(expected '{last_file}' at position {skip_files}), "
+                                             f"run without --resume to start over.")
+                    continue
+
+                if self.cancel_event.is_set():
+                    self.cancelled = True
+                    self.logger.warning("Processing cancelled, saving the current output file.")
+                    break
+
+                self.logger.info(f"Processing file: {relative_path}")
+                block = self.build_block(file_path)
+                if block is not None:
+                    if manifest:
+                        manifest.add(index, *block)
+                    else:
+                        relative_path, path_block, block_token_count = block
+                        for assembler in self.assemblers:
+                            assembler.add_block(path_block, block_token_count, relative_path)
                 file_count += 1
+                last_file = relative_path
 
-        # Save any remaining content
-        if self.content:
-            self.save_current_content()
+                if self.progress_callback or checkpoint_interval:
+                    try:
+                        bytes_done += file_path.stat().st_size
+                    except OSError:
+                        pass
+                if self.progress_callback:
+                    self.progress_callback(file_count, bytes_done)
+                if checkpoint_interval and file_count % checkpoint_interval == 0:
+                    self.save_checkpoint(file_count, bytes_done, last_file)
+
+            if file_count < skip_files:
+                raise ConcatextError("Error: The directory changed since the checkpoint was saved, "
+                                     "run without --resume to start over.")
+
+            # A cancelled run can be resumed from its last position,
+            # the partial output file saved below is then rewritten
+            if self.cancelled and checkpoint_interval:
+                self.save_checkpoint(file_count, bytes_done, last_file)
+
+            if manifest:
+                # An incomplete manifest would silently drop files from the merged output
+                if not self.cancelled:
+                    self.output_files.append(manifest.close())
+                    manifest = None
+            else:
+                # Save any remaining content
+                for assembler in self.assemblers:
+                    if assembler.content:
+                        assembler.save_current_content()
+        finally:
+            if manifest:
+                manifest.abort()
+            self.writer.close()
+
+        # Ratios are only updated by complete runs, so a resumed run reads files exactly as before
+        if not self.cancelled:
+            # Runs without checkpoints leave the checkpoint of an interrupted run resumable
+            if checkpoint_interval:
+                self.remove_checkpoint()
+            if not self.shard:
+                # A shard only sees part of the tree, its manifest would be incomplete
+                if self.file_manifest:
+                    self.save_file_manifest()
+            self.save_token_ratios()
+        if self.hotspots:
+            self.save_hotspot_report()
+        if report:
+            self.print_summary(file_count, self.ignored_files_count, self.ignored_dirs_count)
 
-        self.print_summary(file_count, ignored_files_count, ignored_dirs_count)
+    def budget_sort_key(self, relative_path, stat, estimate):
+        """
+        Rank a file for the token budget, lower keys are selected first.
+        
+        The budget_priority rules are applied in order, each one breaking the ties of the previous:
+            explicit  - files of budget_files first, in list order
+            patterns  - files matching budget_patterns first, in pattern order
+            recent    - most recently modified first
+            smallest  - fewest estimated tokens first
+        """
+        key_path = Path(relative_path).as_posix()
+        key = []
+        for rule in self.budget_priority:
+            if rule == "explicit":
+                key.append(self.budget_file_ranks.get(key_path, len(self.budget_file_ranks)))
+            elif rule == "patterns":
+                key.append(next((rank for rank, pattern in enumerate(self.budget_patterns)
+                                 if fnmatch.fnmatch(key_path, pattern)), len(self.budget_patterns)))
+            elif rule == "recent":
+                key.append(-stat.st_mtime)
+            elif rule == "smallest":
+                key.append(estimate)
+        return key
+
+    def estimate_content_tokens(self, file_path, size):
+        """Estimate the tokens of the content read_file returns for a file of the given size."""
+        ext = file_extension(file_path)
+        ratio = self.token_ratios.get(ext, self.default_bytes_per_token)
+        if self.notebooks["enabled"] and ext == ".ipynb":
+            # Only the cells end up in the output, a fraction of the notebook size
+            try:
+                content, _ = self.extract_notebook(file_path)
+                return len(content.encode('utf-8')) / ratio
+            except (OSError,) + NOTEBOOK_ERRORS:
+                pass  # Read as text
+        # Content based detection would read every file, name based matches are enough for an estimate
+        reason = self.classify_file(file_path, by_name_only=True) if self.generated_files["enabled"] else None
+        if reason:
+            if self.generated_files["action"] == "skip":
+                return 0
+            return self.count_tokens(self.generated_files["placeholder"].replace("{reason}", reason), ext)
+        estimate = size / ratio
+        limit = self.file_token_limit(file_path) if self.file_token_limits else None
+        return min(estimate, limit) if limit is not None else estimate
+
+    def select_budget_files(self):
+        """
+        Choose the files processed in token budget mode, without reading them.
+        
+        Tokens are estimated from file sizes with the bytes-per-token ratios, capped by
+        file_token_limits, plus approximate_token_margin. Files are taken
+        by priority while their estimates fit total_token_budget, smaller files of lower
+        priority can still fill the remaining space.
+        
+        Returns:
+            list: Paths of the selected files, in priority order
+        """
+        # Template and separator cost the same for every file
+        overhead = self.count_tokens(self.format_file_block("", ""))
+        if self.file_separator:
+            overhead += self.count_tokens(self.file_separator)
+
+        candidates = []
+        for index, file_path in enumerate(self.walk_files(log_ignored=False)):
+            relative_path = self.relative_name(file_path)
+            if self.changed_since and not self.track_file(file_path, relative_path):
+                continue
+            try:
+                stat = file_path.stat()
+            except OSError:
+                continue
+            # The safety margin limits the files dropped later because their real count is higher
+            estimate = (overhead + self.estimate_content_tokens(file_path, stat.st_size)) * (1 + self.approximate_token_margin)
+            candidates.append((self.budget_sort_key(relative_path, stat, estimate), index, file_path, relative_path, estimate))
+
+        # Only the selected files are walked again, the ignored counters of this walk are kept
+        candidates.sort(key=lambda candidate: candidate[:2])
+        selected = []
+        estimated_tokens = 0
+        for _, _, file_path, relative_path, estimate in candidates:
+            if estimated_tokens + estimate <= self.total_token_budget:
+                selected.append(file_path)
+                estimated_tokens += estimate
+        self.over_budget_files_count = len(candidates) - len(selected)
+
+        missing = set(self.budget_file_ranks) - {Path(path).as_posix() for _, _, _, path, _ in candidates}
+        if missing:
+            self.logger.warning(f"Files of budget_files not found or ignored: {', '.join(sorted(missing))}")
+        self.logger.info(f"Token budget: selected {len(selected)} of {len(candidates)} files, "
+                         f"~{round(estimated_tokens):,} estimated tokens")
+        return selected
+
+    def charge_budget(self, block):
+        """Count a block against the token budget, returning None if its real count does not fit."""
+        relative_path, _, block_token_count = block
+        # Separators between files count too, as they end up in the output
+        cost = block_token_count + (self.assemblers[0].separator_token_count if self.budget_used else 0)
+        if self.budget_used + cost > self.total_token_budget:
+            # The estimates were too low, the files of lowest priority are dropped to keep the budget exact
+            self.logger.warning(f"Skipping {relative_path}: {block_token_count:,} tokens exceed the remaining budget")
+            self.over_budget_files_count += 1
+            return None
+        self.budget_used += cost
+        return block
+
+    def load_changed_files(self):
+        """Load the reference of changed_since: a previous file manifest, or else a git revision."""
+        if Path(self.changed_since).is_file():
+            try:
+                with open(self.changed_since, 'r', encoding='utf-8') as f:
+                    self.previous_manifest = json.load(f)['files']
+            except (OSError, ValueError, KeyError) as e:
+                raise ConcatextError(f"Error: Unable to read file manifest '{self.changed_since}': {e}")
+            self.logger.info(f"Comparing files with the manifest {self.changed_since}")
+            return
+
+        def git(*args):
+            try:
+                result = subprocess.run(["git", "-C", str(self.dir_path), *args], capture_output=True, check=True)
+            except FileNotFoundError:
+                raise ConcatextError("Error: git is not installed, changed_since needs git or a file manifest.")
+            except subprocess.CalledProcessError as e:
+                raise ConcatextError(f"Error: git {' '.join(args)} failed: {e.stderr.decode(errors='replace').strip()}")
+            return [path for path in result.stdout.decode('utf-8', errors='surrogateescape').split("\0") if path]
+
+        # Paths relative to dir_path: changes since the revision, plus files git does not track yet
+        changed = git("diff", "--name-only", "--relative", "-z", self.changed_since, "--")
+        untracked = git("ls-files", "--others", "--exclude-standard", "-z")
+        self.changed_files = set(changed) | set(untracked)
+        self.logger.info(f"{len(self.changed_files)} files changed since git revision {self.changed_since}")
+
+    def file_fingerprint(self, file_path, stat):
+        """Return the manifest entry of a file: size, modification time and content hash."""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+
+    def track_file(self, file_path, relative_path):
+        """
+        Check whether a file changed since changed_since, recording its file manifest entry.
+        
+        Returns:
+            bool: True if the file must be processed
+        """
+        # Manifests and git use "/" separators on every host
+        key = Path(relative_path).as_posix()
+        if self.changed_files is not None and not self.file_manifest:
+            return key in self.changed_files
+
+        try:
+            stat = file_path.stat()
+            previous = (self.previous_manifest or {}).get(key)
+            # Same size and modification time: the previous hash is trusted without reading the file
+            if previous and previous['size'] == stat.st_size and previous['mtime_ns'] == stat.st_mtime_ns:
+                entry = previous
+            else:
+                entry = self.file_fingerprint(file_path, stat)
+        except OSError:
+            return True  # read_file reports unreadable files
+        if self.file_manifest:
+            self.manifest_entries[key] = entry
+
+        if self.changed_files is not None:
+            return key in self.changed_files
+        if self.previous_manifest is not None:
+            return not previous or previous['sha256'] != entry['sha256']
+        return True
+
+    def save_file_manifest(self):
+        """Write the size, modification time and hash of every candidate file, for --changed-since."""
+        manifest = {'dir_name': self.dir_name, 'created': datetime.now().isoformat(timespec='seconds'),
+                    'files': self.manifest_entries}
+        try:
+            write_atomic(self.file_manifest_path, json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8'))
+            self.logger.info(f"File manifest saved to {self.file_manifest_path}")
+        except OSError as e:
+            self.logger.warning(f"Failed to save file manifest: {e}")
+
+    def save_hotspot_report(self):
+        """Write the hotspot report as <dir>_hotspots.json and <dir>_hotspots.txt in the output directory."""
+        report = self.hotspots.to_dict()
+        report = {'dir_name': self.dir_name, 'cancelled': self.cancelled, **report}
+        if self.shard:
+            report['shard'] = f"{self.shard[0]}/{self.shard[1]}"
+        # Shards write separate reports, as they write separate manifests
+        suffix = f"_shard_{self.shard[0]}of{self.shard[1]}" if self.shard else ""
+        base = self.output_dir / f"{self.dir_name}{suffix}_hotspots"
+        try:
+            write_atomic(base.with_name(base.name + ".json"), json.dumps(report, indent=2).encode('utf-8'))
+            write_atomic(base.with_name(base.name + ".txt"), self.hotspots.format_table(report).encode('utf-8'))
+            self.logger.info(f"Hotspot report saved to {base}.json and {base}.txt")
+        except OSError as e:
+            self.logger.warning(f"Failed to save hotspot report: {e}")
+
+    def in_shard(self, index, relative_path, total_files):
+        """
+        Check whether a file belongs to the shard of this run.
+        
+        Args:
+            index (int): Position of the file in the walk
+            relative_path (str): Path of the file relative to the processed directory
+            total_files (int): Number of files in the walk, used by the "range" method
+        
+        Returns:
+            bool: True if this run processes the file
+        """
+        shard, shards = self.shard
+        if self.shard_method == "range":
+            return (shard - 1) * total_files // shards <= index < shard * total_files // shards
+        digest = hashlib.sha1(relative_path.encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big') % shards == shard - 1
+
+    def open_shard_manifest(self, separator_token_count):
+        """Start the manifest of this shard, named <dir>_shard_<i>of<N>.jsonl."""
+        shard, shards = self.shard
+        manifest_file = self.output_dir / f'{self.dir_name}_shard_{shard}of{shards}.jsonl'
+        header = {
+            'dir_name': self.dir_name,
+            'shard': shard,
+            'shards': shards,
+            'shard_method': self.shard_method,
+            'file_separator': self.file_separator,
+            'separator_tokens': separator_token_count,
+            'output_format': self.output_format,
+            'config': self.shard_fingerprint,
+        }
+        return ShardManifestWriter(manifest_file, header)
+
+class JobLogger(logging.LoggerAdapter):
+    """Logger adapter prefixing the messages of a server job with its id."""
+    def process(self, msg, kwargs):
+        """Prefix a message with the job id."""
+        return f"[job {self.extra['job']}] {msg}", kwargs
+
+class ConcatextServer(ThreadingHTTPServer):
+    """
+    Local HTTP server running concatext jobs in a bounded worker pool, so the
+    tokenizer, compiled patterns and configuration stay loaded between jobs.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, base_config, workers):
+        super().__init__(address, ServeRequestHandler)
+        self.base_config = base_config
+        self.workers = workers
+        # Jobs beyond the pool size wait for a free worker
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="concatext-job")
+        self.job_counter = 0
+        self.active_jobs = 0
+        self.lock = threading.Lock()
+
+    def create_processor(self, job, output_stream):
+        """Build the processor of a job request, raises ConcatextError for invalid jobs."""
+        if not isinstance(job, dict) or not isinstance(job.get("config", {}), dict):
+            raise ConcatextError('Error: Expected a JSON object {"dir_path": ..., "config": {...}}.')
+        config = {**self.base_config, **job.get("config", {})}
+        if job.get("dir_path"):
+            config["dir_path"] = job["dir_path"]
+        if not config.get("dir_path"):
+            raise ConcatextError("Error: 'dir_path' not specified.")
+        # Chunks are always sent back as frames, checkpoints and shards do not apply
+        config["stream_format"] = "frames"
+        config.pop("shard", None)
+        with self.lock:
+            self.job_counter += 1
+            # A single logger for all jobs, loggers are never freed once created
+            job_logger = JobLogger(logger, {'job': self.job_counter})
+        return DirContentProcessor(config, output_stream=output_stream, logger=job_logger)
+
+    def run_job(self, processor):
+        """Run a job in a pool worker and return its trailer record."""
+        with self.lock:
+            self.active_jobs += 1
+        try:
+            processor.process_dir(report=False)
+            return {
+                'done': True,
+                'cancelled': processor.cancelled,
+                'chunks': len(processor.output_files),
+                'total_tokens': sum(f['token_count'] for f in processor.output_files),
+                'source_files': sum(f['source_file_count'] for f in processor.output_files),
+                'seconds': round(time.time() - processor.start_time, 3),
+            }
+        except ConcatextError as e:
+            processor.logger.error(str(e))
+            return {'error': str(e)}
+        except Exception as e:
+            processor.logger.exception("Job failed")
+            return {'error': f"Error during processing: {e}"}
+        finally:
+            with self.lock:
+                self.active_jobs -= 1
+
+class ServeRequestHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of the serve mode.
+    
+    POST /jobs takes {"dir_path": ..., "config": {...overrides}} and streams the chunks
+    back in the "frames" format of --stdout, followed by a JSON trailer line with the
+    totals ("done") or an "error". GET /health reports the worker pool state.
+    """
+    server_version = "concatext"
+
+    def do_GET(self):
+        """Report the server state."""
+        if self.path != "/health":
+            self.send_json(404, {'error': "Not found"})
+            return
+        self.send_json(200, {'status': "ok", 'workers': self.server.workers, 'active_jobs': self.server.active_jobs})
+
+    def do_POST(self):
+        """Run a job and stream its chunks."""
+        if self.path != "/jobs":
+            self.send_json(404, {'error': "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            job = json.loads(self.rfile.read(length) or b"{}")
+            processor = self.server.create_processor(job, self.wfile)
+        except (ValueError, ConcatextError) as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        except Exception as e:
+            # Configuration overrides of the wrong type fail inside DirContentProcessor
+            logger.warning(f"Rejected job with an invalid configuration: {e!r}")
+            self.send_json(400, {'error': f"Error: Invalid job configuration: {e}"})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-concatext-frames")
+        self.end_headers()
+        trailer = self.server.pool.submit(self.server.run_job, processor).result()
+        try:
+            self.wfile.write((json.dumps(trailer) + "\n").encode('utf-8'))
+        except OSError:
+            pass  # The client went away, the job was already cancelled
+
+    def send_json(self, status, record):
+        """Send a complete JSON response."""
+        data = (json.dumps(record) + "\n").encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        """Route request logs through the concatext logger."""
+        logger.info(f"{self.address_string()} - {format % args}")
+
+def serve(config, address):
+    """
+    Run the local job server until interrupted.
+    
+    Args:
+        config (dict): Base configuration, overridden per job
+        address (str): "[HOST:]PORT" to listen on, HOST defaults to 127.0.0.1
+    """
+    host, _, port = address.rpartition(":")
+    try:
+        address = (host or "127.0.0.1", int(port))
+    except ValueError:
+        raise ConcatextError(f"Error: Invalid address '{address}', expected [HOST:]PORT.")
+    workers = config.get("serve_workers", 2)
+    server = ConcatextServer(address, config, workers)
+
+    # Load the tokenizer data once, before the first job
+    word_tokenize("Warm up the tokenizer.", preserve_line=True)
+    logger.info(f"Serving concatext jobs on http://{address[0]}:{server.server_address[1]} with {workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down")
+    finally:
+        server.server_close()
+        server.pool.shutdown(wait=False, cancel_futures=True)
 
 def parse_arguments():
     """Parse command line arguments."""
     parser = argparse.ArgumentParser(description='Process a directory and concatenate its contents into text files.')
     parser.add_argument('dir_path', nargs='?', help='Path to the directory to process')
+    parser.add_argument('--estimate', action='store_true',
+                        help='Only estimate the token total and output file count, without writing output')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue an interrupted run from its last checkpoint')
+    parser.add_argument('--shard', metavar='I/N',
+                        help='Process only shard I of N and write its manifest instead of output files')
+    parser.add_argument('--merge', nargs='+', metavar='MANIFEST',
+                        help='Pack the manifests of all shards into the final output files')
+    parser.add_argument('--stdout', action='store_true',
+                        help='Write the chunks to standard output instead of output files (summary goes to stderr)')
+    parser.add_argument('--changed-since', metavar='REV|MANIFEST',
+                        help='Only process files changed since a git revision or a previous file manifest')
+    parser.add_argument('--serve', metavar='[HOST:]PORT',
+                        help='Run a local HTTP server accepting jobs, with the configuration as defaults')
     return parser.parse_args()
 
 def main():
     """Main function."""
     args = parse_arguments()
-    config = load_config(override_dir_path=args.dir_path)
-    processor = DirContentProcessor(config)
-    processor.process_dir()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    try:
+        run(args)
+    except ConcatextError as e:
+        logger.error(str(e))
+        exit(1)
+
+def run(args):
+    """Run the command selected by the command line arguments."""
+    if args.serve:
+        serve(load_config(override_dir_path=args.dir_path, require_dir_path=False), args.serve)
+        return
+    output_stream = None
+    if args.stdout:
+        if args.shard or args.estimate:
+            raise ConcatextError("Error: --stdout cannot be combined with --shard or --estimate.")
+        # Chunks go to the real standard output, everything printed goes to stderr
+        output_stream = sys.stdout.buffer
+    with contextlib.redirect_stdout(sys.stderr) if output_stream else contextlib.nullcontext():
+        if args.merge:
+            config = load_config(override_dir_path=args.dir_path, require_dir_path=False)
+            merge_manifests(config, args.merge, output_stream=output_stream)
+            return
+        config = load_config(override_dir_path=args.dir_path)
+        if args.shard:
+            config["shard"] = args.shard
+        if args.changed_since:
+            config["changed_since"] = args.changed_since
+        processor = DirContentProcessor(config, output_stream=output_stream)
+        if args.estimate:
+            processor.print_estimate(processor.estimate_dir())
+        else:
+            processor.process_dir(resume=args.resume)
+            # A reader that went away, e.g. "| head", gets an incomplete output
+            if output_stream and processor.writer.broken:
+                raise ConcatextError("Error: The output stream was closed before all chunks were written.")
 
 if __name__ == "__main__":
     main()
@@ -11,12 +11,149 @@ import yaml
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox, simpledialog
 from pathlib import Path
-import threading
 import subprocess
+import queue
+import time
+import logging
+import threading
+import multiprocessing
 
 # Import functionalities from the main module
 import concatext
 
+# Log rendering settings
+LOG_FILE = "concatext_gui.log"  # Full log, the log area only keeps the most recent lines
+LOG_MAX_LINES = 5000  # Maximum number of lines kept in the log area
+LOG_FLUSH_INTERVAL_MS = 100  # How often queued log output is rendered
+PROGRESS_INTERVAL_MS = 250  # How often the progress bar is refreshed while processing
+
+WORKER_MAX_EVENTS = 2000  # Maximum worker events handled per refresh, keeps the UI responsive
+WORKER_SEND_INTERVAL_MS = 100  # How often the worker sends its batched log output and progress
+SCAN_POLL_INTERVAL_MS = 100  # How often the directory tree checks for a finished pre-scan
+
+class WorkerEvents:
+    """
+    Batches the log output and progress of the worker process, a background thread
+    sends them to the GUI every WORKER_SEND_INTERVAL_MS instead of once per file.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+        # The pipe is shared by the worker and the sending thread
+        self.lock = threading.Lock()
+        self.pending_log = []
+        self.pending_progress = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+    
+    def log(self, text):
+        """Queue log output for the next batch."""
+        with self.lock:
+            self.pending_log.append(text)
+    
+    def progress(self, files, size):
+        """Record the progress, only the latest value is sent."""
+        with self.lock:
+            self.pending_progress = (files, size)
+    
+    def send(self, event):
+        """Send an event right away, after the pending log output and progress."""
+        with self.lock:
+            self.flush_pending()
+            self.conn.send(event)
+    
+    def flush_pending(self):
+        """Send the pending log output and progress, the lock must be held."""
+        if self.pending_log:
+            self.conn.send(("log", "".join(self.pending_log)))
+            self.pending_log = []
+        if self.pending_progress:
+            self.conn.send(("progress",) + self.pending_progress)
+            self.pending_progress = None
+    
+    def run(self):
+        """Send the pending events at a fixed interval until closed."""
+        while not self.stopped.wait(WORKER_SEND_INTERVAL_MS / 1000):
+            with self.lock:
+                self.flush_pending()
+    
+    def close(self):
+        """Stop the sending thread and send what is left."""
+        self.stopped.set()
+        self.thread.join()
+        with self.lock:
+            self.flush_pending()
+
+class PipeWriter:
+    """File-like object that forwards written text to the GUI as log events."""
+    def __init__(self, events):
+        self.events = events
+    
+    def write(self, string):
+        if string:
+            self.events.log(string)
+    
+    def flush(self):
+        pass
+
+class PipeLogHandler(logging.Handler):
+    """Logging handler that forwards formatted records to the GUI as log events."""
+    def __init__(self, events):
+        super().__init__()
+        self.events = events
+    
+    def emit(self, record):
+        try:
+            self.events.log(self.format(record) + "\n")
+        except Exception:
+            self.handleError(record)
+
+def processing_worker(config, conn, cancel_event):
+    """
+    Run DirContentProcessor in a worker process and stream events to the GUI.
+    
+    Events are tuples sent over conn:
+        ("log", text), ("totals", files, bytes), ("progress", files, bytes),
+        ("done", cancelled, output_files) or ("error", message)
+    
+    Args:
+        config (dict): Configuration built from the GUI state
+        conn (Connection): Sending end of the pipe to the GUI
+        cancel_event (Event): Set by the GUI to stop processing
+    """
+    # Everything printed or logged by the processor goes back to the GUI, in batches
+    events = WorkerEvents(conn)
+    sys.stdout = PipeWriter(events)
+    sys.stderr = PipeWriter(events)
+    handler = PipeLogHandler(events)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', '%Y-%m-%d %H:%M:%S'))
+    concatext.logger.addHandler(handler)
+    # Logging is not configured on import, the spawned worker would only pass on warnings
+    concatext.logger.setLevel(logging.INFO)
+    concatext.logger.propagate = False
+    
+    try:
+        processor = concatext.DirContentProcessor(
+            config,
+            progress_callback=events.progress,
+            cancel_event=cancel_event
+        )
+        
+        # Fast pre-scan so progress and ETA can be computed
+        events.send(("totals",) + processor.scan_dir())
+        
+        processor.process_dir()
+        result = ("done", processor.cancelled, processor.output_files)
+    except concatext.ConcatextError as e:
+        result = ("error", str(e))
+    except Exception as e:
+        result = ("error", f"Error during processing: {str(e)}")
+    finally:
+        # The last log output and progress come before the result
+        events.close()
+    conn.send(result)
+    conn.close()
+
 class TemplateEditorDialog(tk.Toplevel):
     def __init__(self, parent, template_text=""):
         super().__init__(parent)
@@ -354,7 +491,7 @@ class ConcatextGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("Concatext")
-        self.root.geometry("580x740")
+        self.root.geometry("580x790")
         self.root.minsize(580, 600)
         
         # Configura lo stile dei pulsanti per ridurre il padding interno
@@ -375,9 +512,34 @@ class ConcatextGUI:
         self.ignore_patterns = [".DS_Store", ".gitignore", "package-lock.json", "*.md", "*.log"]
         self.obscured_words = {}  # Dictionary for word -> placeholder mappings
         
+        # Log output is queued by any thread and rendered in batches by the Tk loop
+        self.log_queue = queue.Queue()
+        try:
+            self.log_file = open(LOG_FILE, "a", encoding="utf-8")
+        except OSError:
+            self.log_file = None
+        
+        # Processing state, updated from the worker process events
+        self.worker = None
+        self.worker_conn = None
+        self.cancel_event = None
+        self.running = False
+        self.progress_totals = (0, 0)  # (files, bytes) found by the pre-scan
+        self.progress_state = (0, 0)  # (files, bytes) processed so far
+        self.progress_start_time = 0
+        
+        # Directory tree pre-scan, run by a background thread
+        self.scan_queue = queue.Queue()
+        self.scan_cancel_event = None
+        self.scan_root = None  # Directory shown in the tree
+        self.scan_stats = {}  # Relative directory ("/" separated) -> {'files', 'bytes', 'tokens'}
+        
         # Base configuration
         self.create_widgets()
         
+        # Start the periodic log flush
+        self.root.after(LOG_FLUSH_INTERVAL_MS, self.flush_log_queue)
+        
         # Load existing configurations, if available
         self.load_config()
     
@@ -483,9 +645,13 @@ class ConcatextGUI:
         if not self.include_non_text.get():
             self.edit_non_text_msg_button.configure(state='disabled')
         
+        # The log and the directory tree share the lower area
+        self.notebook = ttk.Notebook(main_frame)
+        self.notebook.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        
         # Log area
-        log_frame = ttk.LabelFrame(main_frame, text="Log", padding="5")
-        log_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        log_frame = ttk.Frame(self.notebook, padding="5")
+        self.notebook.add(log_frame, text="Log")
         
         # Create a frame for the log area to fix the scrollbar issue
         log_container = ttk.Frame(log_frame)
@@ -512,11 +678,58 @@ class ConcatextGUI:
         # Add clear button at bottom left
         ttk.Button(log_buttons_frame, text="Clear", command=self.clear_log).pack(side=tk.LEFT, padx=2, pady=2)
         
+        # Directory tree with per-directory estimates, filled by a background pre-scan
+        tree_frame = ttk.Frame(self.notebook, padding="5")
+        self.notebook.add(tree_frame, text="Directory Tree")
+        
+        tree_buttons_frame = ttk.Frame(tree_frame)
+        tree_buttons_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        ttk.Button(tree_buttons_frame, text="Scan", command=self.scan_input_dir).pack(side=tk.LEFT, padx=2, pady=2)
+        ttk.Button(tree_buttons_frame, text="Include/Exclude", command=self.toggle_tree_exclusion).pack(side=tk.LEFT, padx=2, pady=2)
+        self.tree_status = tk.StringVar(value="Scan to see the files, size and estimated tokens per folder.")
+        ttk.Label(tree_buttons_frame, textvariable=self.tree_status).pack(side=tk.LEFT, padx=5)
+        
+        tree_container = ttk.Frame(tree_frame)
+        tree_container.pack(fill=tk.BOTH, expand=True)
+        
+        self.dir_tree = ttk.Treeview(tree_container, columns=("files", "size", "tokens", "status"), height=0)
+        self.dir_tree.heading("#0", text="Folder")
+        self.dir_tree.heading("files", text="Files")
+        self.dir_tree.heading("size", text="Size")
+        self.dir_tree.heading("tokens", text="Est. tokens")
+        self.dir_tree.heading("status", text="Status")
+        self.dir_tree.column("#0", width=200)
+        self.dir_tree.column("files", width=60, anchor=tk.E)
+        self.dir_tree.column("size", width=80, anchor=tk.E)
+        self.dir_tree.column("tokens", width=90, anchor=tk.E)
+        self.dir_tree.column("status", width=80)
+        self.dir_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        tree_scrollbar = ttk.Scrollbar(tree_container, command=self.dir_tree.yview)
+        tree_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.dir_tree.config(yscrollcommand=tree_scrollbar.set)
+        
+        # Folders are listed when expanded, double-click toggles their exclusion
+        self.dir_tree.bind("<<TreeviewOpen>>", self.expand_tree_node)
+        self.dir_tree.bind("<Double-1>", self.toggle_tree_exclusion)
+        
+        # Progress bar and status line
+        progress_frame = ttk.Frame(self.root, padding=(10, 0))
+        progress_frame.pack(fill=tk.X)
+        
+        self.progress_var = tk.DoubleVar(value=0)
+        self.progress_text = tk.StringVar(value="")
+        ttk.Progressbar(progress_frame, variable=self.progress_var, maximum=100).pack(fill=tk.X)
+        ttk.Label(progress_frame, textvariable=self.progress_text).pack(anchor=tk.W)
+        
         # Action buttons
         button_frame = ttk.Frame(self.root, padding="10")
         button_frame.pack(fill=tk.X)
         
-        ttk.Button(button_frame, text="Start", command=self.run_concatext).pack(side=tk.RIGHT, padx=2)
+        self.start_button = ttk.Button(button_frame, text="Start", command=self.run_concatext)
+        self.start_button.pack(side=tk.RIGHT, padx=2)
+        self.cancel_button = ttk.Button(button_frame, text="Cancel", command=self.cancel_concatext, state='disabled')
+        self.cancel_button.pack(side=tk.RIGHT, padx=2)
     
     def toggle_non_text_message(self):
         """Enable or disable the placeholder button based on checkbox state"""
@@ -600,12 +813,164 @@ class ConcatextGUI:
         dialog = ListEditorDialog(self.root, "Ignored Directories", self.ignore_dirs)
         self.ignore_dirs = dialog.result
         self.log_message(f"Ignored directories updated. {len(self.ignore_dirs)} directories in list.")
+        self.refresh_tree_values()
     
     def edit_ignore_patterns(self):
         """Open a dialog to edit the ignored file patterns"""
         dialog = ListEditorDialog(self.root, "Ignored File Patterns", self.ignore_patterns)
         self.ignore_patterns = dialog.result
         self.log_message(f"Ignored patterns updated. {len(self.ignore_patterns)} patterns in list.")
+        self.refresh_tree_values()
+    
+    def scan_input_dir(self):
+        """Start a background pre-scan of the input directory for the directory tree"""
+        if not self.input_dir.get() or not Path(self.input_dir.get()).is_dir():
+            messagebox.showerror("Error", "Select an existing input directory before scanning!")
+            return
+        try:
+            config = self.get_current_config()
+        except ValueError:
+            messagebox.showerror("Error", "Maximum number of tokens must be an integer!")
+            return
+        # The scan only walks the tree, the output format does not matter
+        config.setdefault("file_template", "")
+        config.setdefault("non_text_file_placeholder", "")
+        
+        # A new scan replaces a running one
+        if self.scan_cancel_event:
+            self.scan_cancel_event.set()
+        self.scan_cancel_event = threading.Event()
+        self.scan_root = Path(config["dir_path"]).resolve()
+        self.scan_stats = {}
+        self.populate_tree()
+        self.tree_status.set("Scanning...")
+        
+        threading.Thread(target=self.scan_worker, args=(config, self.scan_cancel_event), daemon=True).start()
+        self.root.after(SCAN_POLL_INTERVAL_MS, self.poll_scan)
+    
+    def scan_worker(self, config, cancel_event):
+        """Run the pre-scan in a background thread and queue its result"""
+        try:
+            processor = concatext.DirContentProcessor(config, cancel_event=cancel_event)
+            self.scan_queue.put((cancel_event, processor.scan_tree(), None))
+        except Exception as e:
+            self.scan_queue.put((cancel_event, None, str(e)))
+    
+    def poll_scan(self):
+        """Show the result of the pre-scan once it is available"""
+        try:
+            cancel_event, tree, error = self.scan_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(SCAN_POLL_INTERVAL_MS, self.poll_scan)
+            return
+        
+        if cancel_event is not self.scan_cancel_event:
+            # Result of a replaced scan, keep waiting for the current one
+            self.root.after(SCAN_POLL_INTERVAL_MS, self.poll_scan)
+            return
+        if error:
+            self.tree_status.set("Scan failed.")
+            self.log_message(f"Error scanning input directory: {error}")
+            return
+        
+        self.scan_stats = tree
+        self.refresh_tree_values()
+        self.log_message(f"Scanned {self.scan_root}: {tree.get('', {}).get('files', 0):,} files.")
+    
+    def populate_tree(self):
+        """Show the root folder of the scan, its subfolders are listed when expanded"""
+        self.dir_tree.delete(*self.dir_tree.get_children())
+        self.dir_tree.insert("", tk.END, iid="/", text=self.scan_root.name, values=self.tree_values(""), open=True)
+        self.load_tree_children("/")
+    
+    def load_tree_children(self, item):
+        """List the subfolders of a tree item, each folder is an item with iid "/<relative path>" """
+        self.dir_tree.delete(*self.dir_tree.get_children(item))
+        key = item[1:]
+        for name in self.list_subdirs(self.scan_root / key):
+            child_key = f"{key}/{name}" if key else name
+            child = self.dir_tree.insert(item, tk.END, iid="/" + child_key, text=name, values=self.tree_values(child_key))
+            # Placeholder child, so the folder can be expanded
+            if self.list_subdirs(self.scan_root / child_key):
+                self.dir_tree.insert(child, tk.END, iid="+" + child_key, text="...")
+    
+    def list_subdirs(self, directory):
+        """Return the sorted names of the subfolders of a directory, symbolic links excluded"""
+        try:
+            with os.scandir(directory) as scanner:
+                return sorted(entry.name for entry in scanner if entry.is_dir() and not entry.is_symlink())
+        except OSError:
+            return []
+    
+    def expand_tree_node(self, event=None):
+        """Replace the placeholder of an expanded folder with its subfolders"""
+        item = self.dir_tree.focus()
+        children = self.dir_tree.get_children(item)
+        if len(children) == 1 and children[0].startswith("+"):
+            self.load_tree_children(item)
+    
+    def exclusion_status(self, key):
+        """Describe why a folder is excluded by the ignore settings, or return an empty string"""
+        parts = key.split("/") if key else []
+        for depth, name in enumerate(parts, 1):
+            prefix = "/".join(parts[:depth])
+            if name in self.ignore_dirs or f"{prefix}/*" in self.ignore_patterns:
+                return "excluded" if depth == len(parts) else "in excluded"
+        return ""
+    
+    def tree_values(self, key):
+        """Column values of a folder: files, size, estimated tokens and status"""
+        status = self.exclusion_status(key)
+        stats = self.scan_stats.get(key)
+        if not stats:
+            # Excluded when scanned, or nothing to process in it
+            return ("-", "-", "-", status)
+        return (f"{stats['files']:,}", concatext.format_size(stats['bytes']), f"{stats['tokens']:,}", status)
+    
+    def refresh_tree_values(self, item="/"):
+        """Update the columns of the listed folders and the totals of the selection"""
+        if not self.dir_tree.exists(item):
+            return
+        if not item.startswith("+"):
+            self.dir_tree.item(item, values=self.tree_values(item[1:]))
+        for child in self.dir_tree.get_children(item):
+            self.refresh_tree_values(child)
+        if item != "/":
+            return
+        
+        # Folders excluded since the scan are subtracted from the totals
+        totals = dict(self.scan_stats.get("", {'files': 0, 'bytes': 0, 'tokens': 0}))
+        for key, stats in self.scan_stats.items():
+            parent = key.rpartition("/")[0]
+            if key and self.exclusion_status(key) == "excluded" and not self.exclusion_status(parent):
+                for field in totals:
+                    totals[field] -= stats[field]
+        self.tree_status.set(f"Selected: {totals['files']:,} files, {concatext.format_size(totals['bytes'])}, "
+                             f"~{totals['tokens']:,} tokens")
+    
+    def toggle_tree_exclusion(self, event=None):
+        """Exclude the selected folder from processing, or include it again"""
+        item = self.dir_tree.focus()
+        if not item or not item.startswith("/") or item == "/":
+            return
+        key = item[1:]
+        name = key.rpartition("/")[2]
+        pattern = f"{key}/*"
+        
+        if pattern in self.ignore_patterns:
+            self.ignore_patterns = [p for p in self.ignore_patterns if p != pattern]
+            self.log_message(f"Included folder {key} (removed ignore pattern '{pattern}').")
+        elif name in self.ignore_dirs:
+            self.ignore_dirs = [d for d in self.ignore_dirs if d != name]
+            self.log_message(f"Included folders named '{name}' (removed from ignored directories, "
+                             f"this applies to every folder with this name). Scan again to see their totals.")
+        elif self.exclusion_status(key):
+            messagebox.showinfo("Directory Tree", "A parent folder is excluded, include it first.")
+            return
+        else:
+            self.ignore_patterns = self.ignore_patterns + [pattern]
+            self.log_message(f"Excluded folder {key} (added ignore pattern '{pattern}').")
+        self.refresh_tree_values()
     
     def edit_text_obscuration(self):
         """Open dialog to manage text obscuration mappings"""
@@ -635,7 +1000,12 @@ class ConcatextGUI:
                 if "output_dir" in config:
                     self.output_dir.set(config["output_dir"])
                 if "max_tokens" in config:
-                    self.max_tokens.set(str(config["max_tokens"]))
+                    # Several limits are edited as a comma-separated list
+                    max_tokens = config["max_tokens"]
+                    if isinstance(max_tokens, list):
+                        self.max_tokens.set(", ".join(str(limit) for limit in max_tokens))
+                    else:
+                        self.max_tokens.set(str(max_tokens))
                 if "include_non_text_files" in config:
                     self.include_non_text.set(config["include_non_text_files"])
                     # Update UI based on this setting
@@ -658,32 +1028,50 @@ class ConcatextGUI:
             self.log_message(f"Error loading configuration: {str(e)}")
     
     def log_message(self, message):
-        self.log_area.config(state='normal')  # Temporarily enable writing
-        self.log_area.insert(tk.END, message + "\n")
-        self.log_area.see(tk.END)  # Auto-scroll to bottom
-        self.log_area.config(state='disabled')  # Disable writing again
+        # Safe to call from any thread, the text is rendered by flush_log_queue
+        self.log_queue.put(message + "\n")
     
-    def redirect_stdout(self):
-        class StdoutRedirector:
-            def __init__(self, text_widget):
-                self.text_widget = text_widget
+    def flush_log_queue(self):
+        """Render all queued log output in a single batch and reschedule itself"""
+        chunks = []
+        try:
+            while True:
+                chunks.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        
+        if chunks:
+            text = "".join(chunks)
+            
+            # The log file receives the complete output
+            if self.log_file:
+                try:
+                    self.log_file.write(text)
+                    self.log_file.flush()
+                except OSError:
+                    pass
+            
+            # Only the most recent lines of a large batch are worth inserting
+            if text.count("\n") > LOG_MAX_LINES:
+                text = "".join(text.splitlines(keepends=True)[-LOG_MAX_LINES:])
             
-            def write(self, string):
-                # Use after to safely update the GUI from another thread
-                self.text_widget.after(0, self._write, string)
+            self.log_area.config(state='normal')  # Temporarily enable writing
+            self.log_area.insert(tk.END, text)
             
-            def _write(self, string):
-                self.text_widget.config(state='normal')
-                self.text_widget.insert(tk.END, string)
-                self.text_widget.see(tk.END)
-                self.text_widget.config(state='disabled')
+            # Keep a bounded ring of lines in the widget
+            line_count = int(self.log_area.index('end-1c').split('.')[0])
+            if line_count > LOG_MAX_LINES:
+                self.log_area.delete("1.0", f"{line_count - LOG_MAX_LINES + 1}.0")
             
-            def flush(self):
-                pass
+            self.log_area.see(tk.END)  # Auto-scroll to bottom
+            self.log_area.config(state='disabled')  # Disable writing again
         
-        # Redirect stdout and stderr to the text widget
-        sys.stdout = StdoutRedirector(self.log_area)
-        sys.stderr = StdoutRedirector(self.log_area)
+        self.root.after(LOG_FLUSH_INTERVAL_MS, self.flush_log_queue)
+    
+    def parse_max_tokens(self):
+        """Read the Max Tokens field: an integer, or a list for comma-separated limits"""
+        limits = [int(limit) for limit in self.max_tokens.get().split(",")]
+        return limits if len(limits) > 1 else limits[0]
     
     def get_current_config(self):
         """
@@ -693,11 +1081,13 @@ class ConcatextGUI:
         config = {
             "dir_path": self.input_dir.get(),
             "output_dir": self.output_dir.get(),
-            "max_tokens": int(self.max_tokens.get()),
+            "max_tokens": self.parse_max_tokens(),
             "include_non_text_files": self.include_non_text.get(),
             "ignore_dirs": self.ignore_dirs,
             "ignore_patterns": self.ignore_patterns,
             "file_separator": self.file_separator,
+            # The GUI cannot resume a run, a cancelled run should not leave a checkpoint behind
+            "checkpoint_interval": 0,
         }
         
         # Only include non-text placeholder if including non-text files
@@ -729,12 +1119,12 @@ class ConcatextGUI:
             return
         
         try:
-            max_tokens = int(self.max_tokens.get())
-            if (max_tokens <= 0):
+            max_tokens = self.parse_max_tokens()
+            if min(max_tokens if isinstance(max_tokens, list) else [max_tokens]) <= 0:
                 messagebox.showerror("Error", "Maximum number of tokens must be greater than zero!")
                 return
         except ValueError:
-            messagebox.showerror("Error", "Maximum number of tokens must be an integer!")
+            messagebox.showerror("Error", "Maximum number of tokens must be an integer or a comma-separated list of integers!")
             return
         
         # Ensure directories exist
@@ -754,32 +1144,120 @@ class ConcatextGUI:
                 messagebox.showerror("Error", f"Unable to create output directory: {str(e)}")
                 return
         
-        # Start processing in a separate thread
+        # Start processing in a separate process
+        self.notebook.select(0)  # Show the log
         self.log_message("Starting Concatext processing...")
         
-        # Redirect stdout to capture output
-        self.redirect_stdout()
+        # Reset progress and button states
+        self.progress_totals = (0, 0)
+        self.progress_state = (0, 0)
+        self.progress_var.set(0)
+        self.progress_text.set("Scanning input directory...")
+        self.progress_start_time = time.time()
+        self.set_running(True)
+        
+        # The worker runs in its own process so tokenization never competes with the UI
+        context = multiprocessing.get_context("spawn")
+        self.cancel_event = context.Event()
+        self.worker_conn, child_conn = context.Pipe(duplex=False)
+        self.worker = context.Process(
+            target=processing_worker,
+            args=(self.get_current_config(), child_conn, self.cancel_event),
+            daemon=True
+        )
+        self.worker.start()
+        child_conn.close()  # Only the worker keeps the sending end open
         
-        # Start the process in a separate thread
-        threading.Thread(target=self.process_thread, daemon=True).start()
+        self.root.after(PROGRESS_INTERVAL_MS, self.poll_worker)
+    
+    def cancel_concatext(self):
+        """Ask the running processor to stop after the current file"""
+        if self.running:
+            self.cancel_event.set()
+            self.cancel_button.configure(state='disabled')
+            self.progress_text.set("Cancelling, saving the current output file...")
+    
+    def set_running(self, running):
+        """Toggle the Start/Cancel buttons for a running or idle process"""
+        self.running = running
+        self.start_button.configure(state='disabled' if running else 'normal')
+        self.cancel_button.configure(state='normal' if running else 'disabled')
     
-    def process_thread(self):
+    def poll_worker(self):
+        """Handle the events sent by the worker process and refresh the progress"""
+        finished = None
         try:
-            # Get current config from GUI instead of loading from file
-            config = self.get_current_config()
-            
-            # Create and start the processor with current GUI settings
-            processor = concatext.DirContentProcessor(config)
-            processor.process_dir()
+            for _ in range(WORKER_MAX_EVENTS):
+                if not self.worker_conn.poll():
+                    break
+                event = self.worker_conn.recv()
+                kind = event[0]
+                if kind == "log":
+                    self.log_queue.put(event[1])
+                elif kind == "totals":
+                    self.progress_totals = (event[1], event[2])
+                    self.progress_start_time = time.time()
+                elif kind == "progress":
+                    self.progress_state = (event[1], event[2])
+                else:
+                    finished = event
+                    break
+        except (EOFError, OSError):
+            # The worker exited without reporting a result
+            finished = ("error", f"Processing stopped unexpectedly (exit code {self.worker.exitcode}).")
+        
+        if finished is None:
+            self.update_progress()
+            self.root.after(PROGRESS_INTERVAL_MS, self.poll_worker)
+            return
+        
+        self.worker_conn.close()
+        self.worker.join()
+        if finished[0] == "done":
+            self.finish_processing(finished[1], finished[2])
+        else:
+            self.log_message(finished[1])
+            self.set_running(False)
+            self.progress_text.set("Processing failed.")
+            messagebox.showerror("Error", finished[1])
+    
+    def update_progress(self):
+        """Refresh the progress bar, throughput and ETA while processing"""
+        total_files, total_bytes = self.progress_totals
+        files_done, bytes_done = self.progress_state
+        
+        if total_files and not self.cancel_event.is_set():
+            # Bytes are a better measure of the remaining work than file counts
+            if total_bytes:
+                fraction = min(bytes_done / total_bytes, 1.0)
+            else:
+                fraction = min(files_done / total_files, 1.0)
+            self.progress_var.set(fraction * 100)
             
-            # Show a custom completion dialog with option to open output folder
-            self.root.after(0, self.show_completion_dialog)
-        except Exception as e:
-            error_msg = f"Error during processing: {str(e)}"
-            self.log_message(error_msg)
-            self.root.after(0, lambda: messagebox.showerror("Error", error_msg))
+            elapsed = time.time() - self.progress_start_time
+            files_per_second = files_done / elapsed if elapsed > 0 else 0
+            if 0 < fraction < 1:
+                eta = f"{elapsed * (1 - fraction) / fraction:.0f}s"
+            else:
+                eta = "-"
+            self.progress_text.set(
+                f"{files_done:,} / {total_files:,} files "
+                f"({concatext.format_size(bytes_done)} / {concatext.format_size(total_bytes)}) - "
+                f"{files_per_second:.1f} files/s - ETA {eta}"
+            )
     
-    def show_completion_dialog(self):
+    def finish_processing(self, cancelled, output_files):
+        """Reset the UI after the worker process has finished"""
+        self.set_running(False)
+        files_done, _ = self.progress_state
+        if cancelled:
+            self.progress_text.set(f"Cancelled after {files_done:,} files.")
+        else:
+            self.progress_var.set(100)
+            self.progress_text.set(f"Completed: {files_done:,} files processed.")
+        self.show_completion_dialog(cancelled, output_files)
+    
+    def show_completion_dialog(self, cancelled=False, output_files=None):
         """Shows a completion message with options to open the output folder"""
         # First make sure the main window's geometry is up to date
         self.root.update_idletasks()
@@ -792,7 +1270,7 @@ class ConcatextGUI:
         
         # Use fixed dimensions that ensure all content is visible
         dialog_width = 500
-        dialog_height = 220
+        dialog_height = 250
         
         # Calculate position to center the dialog relative to parent
         pos_x = parent_x + (parent_width // 2) - (dialog_width // 2)
@@ -804,14 +1282,14 @@ class ConcatextGUI:
         
         # Create dialog with position already set to avoid flickering
         dialog = tk.Toplevel(self.root)
-        dialog.title("Process Completed")
+        dialog.title("Process Cancelled" if cancelled else "Process Completed")
         dialog.geometry(f"{dialog_width}x{dialog_height}+{pos_x}+{pos_y}")
         
         # Make dialog resizable
         dialog.resizable(True, True)
         
         # Set a minimum size
-        dialog.minsize(450, 220)
+        dialog.minsize(450, 250)
         
         # Make dialog modal
         dialog.transient(self.root)
@@ -833,19 +1311,19 @@ class ConcatextGUI:
         message_frame = ttk.Frame(content_frame)
         message_frame.pack(fill=tk.X, pady=(0, 15))
         
-        # Success icon (checkmark)
+        # Success icon (checkmark), or a warning sign when cancelled
         success_label = ttk.Label(
             message_frame,
-            text="✓",
+            text="!" if cancelled else "✓",
             font=("", 24, "bold"),  # Increased font size
-            foreground="green"
+            foreground="orange" if cancelled else "green"
         )
         success_label.pack(side=tk.LEFT, padx=(0, 10))
         
         # Success text
         ttk.Label(
             message_frame,
-            text="Processing completed successfully!",
+            text="Processing cancelled, partial output saved." if cancelled else "Processing completed successfully!",
             font=("", 16, "bold")  # Increased font size
         ).pack(side=tk.LEFT, fill=tk.X)
         
@@ -868,6 +1346,16 @@ class ConcatextGUI:
         )
         path_display.pack(anchor=tk.W, padx=(10, 0))
         
+        # Results reported by the worker process
+        if output_files is not None:
+            total_tokens = sum(f['token_count'] for f in output_files)
+            total_size = sum(f['file_size'] for f in output_files)
+            ttk.Label(
+                path_frame,
+                text=f"{len(output_files)} output files, {total_tokens:,} tokens, {concatext.format_size(total_size)}",
+                font=("", 12)
+            ).pack(anchor=tk.W, padx=(10, 0), pady=(5, 0))
+        
         # Bottom frame that doesn't expand - always stays at bottom
         bottom_frame = ttk.Frame(main_frame)
         bottom_frame.pack(side=tk.BOTTOM, fill=tk.X)
@@ -969,6 +1457,7 @@ class ConcatextGUI:
             messagebox.showerror("Error", f"Unable to open output folder: {str(e)}")
 
 def main():
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = ConcatextGUI(root)
     root.mainloop()
@@ -0,0 +1,27 @@
+"""
+Shared helpers of the concatext tests.
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import concatext
+
+
+def make_processor(output_dir, **overrides):
+    """Create a processor with the defaults of load_config, overridden by keyword arguments."""
+    config = {
+        "dir_path": output_dir,
+        "output_dir": output_dir,
+        "max_tokens": 200000,
+        "ignore_dirs": [],
+        "ignore_patterns": [],
+        "file_template": "===\n{path}\n===\n{content}\n===",
+        "include_non_text_files": True,
+        "non_text_file_placeholder": "non-text file placeholder",
+        "file_separator": "\n\n",
+        "obscured_words": {},
+        **overrides,
+    }
+    return concatext.DirContentProcessor(config)
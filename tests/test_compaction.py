@@ -0,0 +1,52 @@
+"""
+Tests of the compaction stage: comments are stripped, while string literals,
+regex literals and YAML block scalars holding comment markers are kept intact.
+"""
+import tempfile
+import unittest
+
+from helpers import make_processor
+
+
+class CompactionTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.processor = make_processor(self.tmp.name, compaction={"enabled": True})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def compact(self, text, ext):
+        return self.processor.compact_content(text, ext)
+
+    def test_python(self):
+        text = 'x = "# not a comment"  # comment\ns = """\n# kept\n"""\n'
+        self.assertEqual(self.compact(text, ".py"), 'x = "# not a comment"\ns = """\n# kept\n"""')
+
+    def test_js_regex_literals(self):
+        text = 'const re = /\\/\\//g; s.replace(re, "/"); // comment\nif (/[/]x/.test(s)) return /a\\/b/i;\n'
+        self.assertEqual(self.compact(text, ".js"),
+                         'const re = /\\/\\//g; s.replace(re, "/");\nif (/[/]x/.test(s)) return /a\\/b/i;')
+
+    def test_js_division_is_not_a_regex(self):
+        self.assertEqual(self.compact("x = a / b / c; // half\n", ".js"), "x = a / b / c;")
+
+    def test_go_raw_strings(self):
+        self.assertEqual(self.compact("x := `raw // string` // comment\n", ".go"), "x := `raw // string`")
+
+    def test_jvm_text_blocks(self):
+        text = 'String s = """\n  http://example.com // kept\n  """; // comment\n'
+        self.assertEqual(self.compact(text, ".java"), 'String s = """\n  http://example.com // kept\n  """;')
+
+    def test_csharp_verbatim_strings(self):
+        text = 'var p = @"C:\\dir\\"; // comment\nvar q = @"a ""//"" b";\n'
+        self.assertEqual(self.compact(text, ".cs"), 'var p = @"C:\\dir\\";\nvar q = @"a ""//"" b";')
+
+    def test_yaml_block_scalars(self):
+        text = "a: 1 # comment\nc: |\n  text # kept\nlist:\n  - >-\n    item # kept\n  - y # comment\n"
+        self.assertEqual(self.compact(text, ".yaml"),
+                         "a: 1\nc: |\n  text # kept\nlist:\n  - >-\n    item # kept\n  - y")
+
+
+if __name__ == "__main__":
+    unittest.main()
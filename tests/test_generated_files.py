@@ -0,0 +1,54 @@
+"""
+Tests of the generated file classifier: standard generated headers, lockfiles
+and minified assets are detected, hand-written files are left alone.
+"""
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from helpers import make_processor
+
+
+class GeneratedFileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.processor = make_processor(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def classify(self, name, content):
+        file_path = self.dir / name
+        file_path.write_text(content, encoding='utf-8')
+        return self.processor.classify_file(file_path)
+
+    def test_standard_headers(self):
+        self.assertIsNotNone(self.classify("api.go", "// Code generated by protoc-gen-go. DO NOT EDIT.\npackage api\n"))
+        self.assertIsNotNone(self.classify("Schema.php", "<?php\n/** @generated */\n"))
+        self.assertIsNotNone(self.classify("messages.py", "# Generated by the protocol buffer compiler.  DO NOT EDIT!\n"))
+
+    def test_names(self):
+        self.assertEqual(self.classify("yarn.lock", "# yarn lockfile v1\n"), "lockfile")
+        self.assertEqual(self.classify("app.min.js", "var a=1;"), "minified bundle")
+
+    def test_minified_assets(self):
+        reason = self.classify("bundle.js", "var a=1;" * 2000)
+        self.assertTrue(reason.startswith("minified"))
+
+    def test_hand_written_files_are_kept(self):
+        self.assertIsNone(self.classify("models.py", "# id is auto-generated by the database\nclass Model: pass\n"))
+        self.assertIsNone(self.classify("settings.yaml", "# Do not edit values below unless needed\na: 1\n"))
+        self.assertIsNone(self.classify("notes.go", "// Code generated values are checked below\npackage notes\n"))
+        # Data JSON often sits on a single line by design
+        self.assertIsNone(self.classify("fixture.json", json.dumps({f"key{i}": i for i in range(500)})))
+        self.assertIsNone(self.classify("requests.jsonl", json.dumps({"body": "word " * 300}) + "\n"))
+
+    def test_keep_patterns(self):
+        self.processor.generated_files["keep_patterns"] = ["vendor.js"]
+        self.assertIsNone(self.classify("vendor.js", "var a=1;" * 2000))
+
+
+if __name__ == "__main__":
+    unittest.main()
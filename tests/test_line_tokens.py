@@ -0,0 +1,65 @@
+"""
+Tests of the "nltk_lines" tokenizer: line-by-line counting through the line cache,
+compared with whole-text NLTK tokenization.
+"""
+import tempfile
+import unittest
+
+from helpers import make_processor
+
+
+class LineTokenTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.processor = make_processor(self.tmp.name, tokenizer="nltk_lines")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_matches_whole_text(self):
+        texts = [
+            "def main():\n    print('Hello, world!')\n\n    return 0",
+            "===\npath/to/file.py\n===\nimport os\nx = os.path.join(a, b)  # comment\n===",
+            "First line\n\n\nAfter blank lines, with (parentheses) and 3.14 numbers",
+            "It's a test; isn't it? Yes: it is!",
+        ]
+        for text in texts:
+            with self.subTest(text=text):
+                self.assertEqual(self.processor.count_line_tokens(text),
+                                 self.processor.count_nltk_tokens(text))
+
+    def test_final_period_added_back(self):
+        # Lines count "world." and "line." as single tokens, the final period is split
+        # off by whole-text tokenization only, and added back once for the whole text
+        text = "Hello world.\nNext line."
+        self.assertEqual(self.processor.count_nltk_tokens(text), 5)
+        self.assertEqual(self.processor.count_line_tokens(text), 5)
+        self.assertEqual(self.processor.count_line_tokens("No final period"),
+                         self.processor.count_nltk_tokens("No final period"))
+
+    def test_quote_at_line_start_differs(self):
+        # Known difference: whole-text tokenization lets the quote rules look across the
+        # newline, while the line on its own sees an opening quote at its start
+        text = 'He said "hi" to\n"me".'
+        self.assertEqual(self.processor.count_nltk_tokens(text), 10)
+        self.assertEqual(self.processor.count_line_tokens(text), 11)
+
+    def test_result_does_not_depend_on_cache(self):
+        text = "alpha beta\ngamma, delta.\nalpha beta"
+        first = self.processor.count_line_tokens(text)
+        self.assertEqual(self.processor.count_line_tokens(text), first)
+        self.assertEqual(self.processor.line_cache_stats['tokenizer_calls'], 1)
+        self.assertGreater(self.processor.line_cache_stats['hits'], 0)
+
+    def test_cache_evicts_least_recently_used(self):
+        processor = make_processor(self.tmp.name, tokenizer="nltk_lines", line_cache_size=2)
+        processor.count_line_tokens("a x\nb y")
+        self.assertEqual(list(processor.line_cache), ["a x", "b y"])
+        # A hit makes "a x" the most recently used line
+        processor.count_line_tokens("a x")
+        processor.count_line_tokens("c z")
+        self.assertEqual(list(processor.line_cache), ["a x", "c z"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+"""
+Tests of the token budget selection: file estimates account for the content
+that ends up in the output, not the size of the file on disk.
+"""
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from helpers import concatext, make_processor
+
+
+class TokenBudgetTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = Path(self.tmp.name) / "source"
+        self.source.mkdir()
+        self.output = Path(self.tmp.name) / "output"
+        self.output.mkdir()
+        (self.source / "main.py").write_text("print('hello')\n" * 20, encoding='utf-8')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def selected_names(self, **overrides):
+        processor = make_processor(str(self.output), dir_path=str(self.source), total_token_budget=5000, **overrides)
+        return {file_path.name for file_path in processor.select_budget_files()}
+
+    def test_truncated_file_fits(self):
+        (self.source / "data.csv").write_text("".join(f"{i},value{i}\n" for i in range(200000)), encoding='utf-8')
+        self.assertNotIn("data.csv", self.selected_names())
+        self.assertEqual(self.selected_names(file_token_limits={"*.csv": 200}), {"main.py", "data.csv"})
+
+    def test_notebook_outputs_are_not_counted(self):
+        cell = {"cell_type": "code", "source": "x = 1", "outputs": [{"output_type": "display_data",
+                                                                      "data": {"image/png": "A" * 100000}}]}
+        (self.source / "plot.ipynb").write_text(json.dumps({"cells": [cell]}), encoding='utf-8')
+        self.assertEqual(self.selected_names(), {"main.py", "plot.ipynb"})
+
+    def test_generated_file_placeholder(self):
+        (self.source / "package-lock.json").write_text(json.dumps({"packages": {f"p{i}": i for i in range(50000)}}),
+                                                       encoding='utf-8')
+        self.assertEqual(self.selected_names(), {"main.py", "package-lock.json"})
+
+    def test_sharding_is_rejected(self):
+        with self.assertRaises(concatext.ConcatextError):
+            make_processor(str(self.output), dir_path=str(self.source), total_token_budget=5000, shard="1/2",
+                           ordering="sorted")
+
+
+if __name__ == "__main__":
+    unittest.main()